@@ -1,58 +1,245 @@
 import copy
+import multiprocessing
 import random
+import sys
 import threading
 import time
 import numpy as np
 import math
 import Board
+import Book
+import Tablebase
+import Telemetry
+from Ordering import MoveOrderer
+from Parallel import RootSplitter
+from Transposition import TranspositionTable, EXACT, LOWER, UPPER, NO_MOVE
+
+
+WIN = 5000  # evaluation of a won position
+NULL_WINDOW = 1  # width of the windows that only test whether a move beats alpha
+# A solved tablebase position scores WIN + MAX_PLYS minus the plys from the root to the end of the game, so the
+# search prefers the fastest win and the longest defence. The scores stay beyond WIN.
+MAX_PLYS = 1000
+# AlphaBetaAgent attributes that change how a position is searched, passed on to the root splitter's workers
+SEARCH_SETTINGS = ("threshold", "batch_leaves", "quiescence_depth", "pvs", "aspiration", "symmetry", "null_move",
+                   "null_reduction", "null_min_moves", "lmr", "lmr_moves", "lmr_depth", "lmr_reduction", "futility",
+                   "futility_depth", "futility_margin")
+
+
+def tablebase_value(result, distance, ply):
+    """
+    :param result: tablebase result for the side to move, distance: plys to the end of the game from the node
+    :param ply: plys from the root to the node
+    """
+    return result * (WIN + MAX_PLYS - ply - distance)
+
+
+def to_table(value, ply):
+    """
+    Transposition table form of a value: tablebase scores are stored relative to the node, not to the root.
+    """
+    if value > WIN:
+        return value + ply
+    if value < -WIN:
+        return value - ply
+    return value
+
+
+def from_table(value, ply):
+    """
+    Value of a transposition table entry probed ply plys from the root, see to_table.
+    """
+    if value > WIN:
+        return value - ply
+    if value < -WIN:
+        return value + ply
+    return value
+
+
+def evaluate_batch(agent, boards, white_turn):
+    """
+    Static evaluation of a stack of positions in a few array operations, equal to Agent.evaluate of the agent on
+    each of them, for callers with many positions at once. alphabeta deliberately scores the children of depth 1
+    nodes with Agent.evaluate_bits instead: on the few dozen children of a node the array setup costs more than
+    it saves (see Bench evaluate).
+    :param boards: (N, 2) packed white and black boards, or (N, 2, 10, 10) padded boards
+    :param white_turn: the side to move, of all positions or (N,) of each one
+    :return: (N,) scores
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        cells = np.unpackbits(boards.astype('<u8').view(np.uint8).reshape(-1, 2, 8), axis=2, bitorder='little')
+        cells = cells.reshape(-1, 2, 8, 8).astype(bool)
+    else:
+        cells = boards[:, :, 1:9, 1:9].astype(bool)
+    white, black = cells[:, 0], cells[:, 1]
+    white_turn = np.broadcast_to(np.asarray(white_turn, dtype=bool), (len(cells),))
+    rows = np.arange(8)[None, :, None]
+
+    # First option: winning by going straight to the final row
+    # a pawn is an attacker if no enemy pawn is ahead of it on its column and the two next to it
+    black_span = black.copy()
+    black_span[:, :, 1:] |= black[:, :, :-1]
+    black_span[:, :, :-1] |= black[:, :, 1:]
+    black_ahead = np.zeros_like(black)
+    black_ahead[:, 1:] = np.logical_or.accumulate(black_span, axis=1)[:, :-1]
+    white_span = white.copy()
+    white_span[:, :, 1:] |= white[:, :, :-1]
+    white_span[:, :, :-1] |= white[:, :, 1:]
+    white_ahead = np.zeros_like(white)
+    white_ahead[:, :-1] = np.logical_or.accumulate(white_span[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    closest_white_dist = np.where(white & ~black_ahead & (rows <= 3), rows, 10).min(axis=(1, 2))
+    closest_black_dist = np.where(black & ~white_ahead & (rows >= 4), 7 - rows, 10).min(axis=(1, 2))
+    tie = (closest_white_dist == closest_black_dist) & (closest_black_dist != 10)  # look at next step
+    closest_white_dist = closest_white_dist - (tie & white_turn)
+    closest_black_dist = closest_black_dist - (tie & ~white_turn)
+    mine, theirs = (closest_white_dist, closest_black_dist) if agent.is_white else \
+        (closest_black_dist, closest_white_dist)
+    attackers = np.where(mine < theirs, 1000 * (5 - mine), -1000 * (5 - theirs))
+
+    # Second option: winning by disabling the opponent of moving
+    empty = ~(white | black)
+    white_moves = (white[:, 1:] & empty[:, :-1]).sum(axis=(1, 2)) + \
+        (white[:, 6] & empty[:, 5] & empty[:, 4]).sum(axis=1) + \
+        (black[:, :-1, :-1] & white[:, 1:, 1:]).sum(axis=(1, 2)) + \
+        (black[:, :-1, 1:] & white[:, 1:, :-1]).sum(axis=(1, 2))
+    black_moves = (black[:, :-1] & empty[:, 1:]).sum(axis=(1, 2)) + \
+        (black[:, 1] & empty[:, 2] & empty[:, 3]).sum(axis=1) + \
+        (black[:, :-1, 1:] & white[:, 1:, :-1]).sum(axis=(1, 2)) + \
+        (black[:, :-1, :-1] & white[:, 1:, 1:]).sum(axis=(1, 2))
+    legal_moves = np.minimum(agent.threshold, np.where(white_turn, white_moves, black_moves))
+    my_turn = white_turn == agent.is_white
+    mobility = np.where(my_turn, -5000, 5000) * (agent.threshold - legal_moves) / agent.threshold
+
+    # Third option: kill as much pawns as possible
+    white_pawns, black_pawns = white.sum(axis=(1, 2)), black.sum(axis=(1, 2))
+    my_pawns, their_pawns = (white_pawns, black_pawns) if agent.is_white else (black_pawns, white_pawns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        material = (my_pawns - their_pawns) / my_pawns * 5000
+    return np.where(mine != theirs, attackers, np.where(mobility != 0, mobility, material))
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when its deadline has passed.
+    """
 
 
 class Graph:
-    def __init__(self):
+    """
+    Graph of the visited positions, keyed by the Zobrist hash of the board up to the file mirror: a position and
+    its mirror image share a node, and their minimax values are the same.
+    :param verify: if True, stored boards are compared on lookups and hash collisions are counted
+    """
+
+    def __init__(self, verify=False):
         self.graph = {}
+        self.verify = verify
+        self.collisions = 0
 
     class Node:
-        def __init__(self, board):
-            self.board = board  # FBoard object
-            self.is_terminal = board.is_checkmate()  # overridden
+        """
+        A position, stored once in packed form, with its children and parents as Zobrist hashes. The board and
+        its moves are rebuilt when needed, so a node holds no move list.
+        """
+        __slots__ = ("white_bits", "black_bits", "white_turn", "is_computed", "is_exploited", "h", "children",
+                     "parents", "pending")
+
+        def __init__(self, white, black, white_turn):
+            self.white_bits = white
+            self.black_bits = black
+            self.white_turn = white_turn
             self.is_computed = False
             self.is_exploited = False
             self.h = 0
-            self.children = []
-            self.parents = []
-            self.h_time = 0
+            self.children = ()  # a list once the first child is added
+            self.parents = ()
+            self.pending = None  # board and staged move generator of the children not created yet
+
+        @property
+        def board(self):
+            return Board.FBoard(white=self.white_bits, black=self.black_bits, white_turn=self.white_turn)
+
+        @property
+        def is_terminal(self):
+            return Board.FBoard.is_checkmate(self)  # only reads the packed boards and the side to move
+
+        def key(self):
+            return self.white_bits, self.black_bits, self.white_turn
+
+    def children(self, node_key):
+        """
+        Generates the keys of a node's children. Children are created lazily, captures first,
+        so a search that cuts off never generates or stores the siblings after the cutoff.
+        """
+        key = self.get_key(node_key)
+        node = self.graph[key]
+        i = 0
+        while True:
+            if i < len(node.children):
+                yield node.children[i]
+                i += 1
+                continue
+            if node.is_exploited:
+                return
+            if node.pending is None:
+                board = node.board
+                node.pending = board, board.staged_moves()
+            board, moves = node.pending
+            move = next(moves, None)
+            if move is None:
+                node.pending = None
+                node.is_exploited = True
+                return
+            self.add_child(key, node, board, move)
+
+    def add_child(self, key, node, board, move):
+        undo = board.push(move)
+        child_key = board.canonical_hash()[0]
+        # if first visited. append
+        if not child_key in self.graph:
+            self.graph[child_key] = Graph.Node(board.white_bits, board.black_bits, board.white_turn)
+        elif self.verify:
+            self.check_collision(child_key, board.key())
+        board.pop(undo)
+        child = self.graph[child_key]
+        # if not in children list, append kid
+        if not child_key in node.children:
+            if not node.children:
+                node.children = []
+            node.children.append(child_key)
+        # if parent not in list
+        if not key in child.parents:
+            if not child.parents:
+                child.parents = []
+            child.parents.append(key)
 
     def exploit(self, node_key):
-        for move in self.graph[self.get_key(node_key)].board.moves:
-            # copy board and move
-            tmp_board = self.graph[self.get_key(node_key)].board.copy()
-            tmp_board.make_move(move)
-            # if first visited. append
-            if not self.get_key(tmp_board.key()) in self.graph.keys():
-                self.graph[self.get_key(tmp_board.key())] = Graph.Node(tmp_board)
-            # if not in children list, append kid
-            if not self.get_key(tmp_board.key()) in self.graph[self.get_key(node_key)].children:
-                self.graph[self.get_key(node_key)].children.append(self.get_key(tmp_board.key()))
-            # if parent not in list
-            if not self.get_key(node_key) in self.graph[self.get_key(tmp_board.key())].parents:
-                self.graph[self.get_key(tmp_board.key())].parents.append(self.get_key(node_key))
-            self.graph[self.get_key(node_key)].is_exploited = True
+        for _ in self.children(node_key):
+            pass
 
     def add_node(self, board_key):
-        self.graph[self.get_key(board_key)] = self.Node(
-            Board.FBoard(white=board_key[0], black=board_key[1], white_turn=board_key[2]))
+        self.graph[self.get_key(board_key)] = self.Node(board_key[0], board_key[1], board_key[2])
 
     def get_key(self, board_key):
-        if isinstance(board_key, str):
+        if isinstance(board_key, int):
             return board_key
-        return np.array2string(board_key[0]) + np.array2string(board_key[1]) + str(board_key[2])
+        h = Board.zobrist(board_key[0], board_key[1], board_key[2])
+        return min(h, Board.mirror_hash(h))
+
+    def check_collision(self, key, board_key):
+        white, black, white_turn = self.graph[key].key()
+        if board_key != (white, black, white_turn) and board_key != (Board.mirror(white), Board.mirror(black),
+                                                                     white_turn):
+            self.collisions += 1
 
     def get_node(self, board_key):
-        if not self.get_key(board_key) in self.graph.keys():
+        key = self.get_key(board_key)
+        if not key in self.graph:
             self.add_node(board_key)
-        if not self.graph[self.get_key(board_key)].is_exploited:
-            self.exploit(board_key)
-        return self.graph[self.get_key(board_key)]
+        elif self.verify and not isinstance(board_key, int):
+            self.check_collision(key, board_key)
+        return self.graph[key]
 
 
 class Agent:
@@ -61,15 +248,17 @@ class Agent:
     :param board: a ChessGame to run the agent on
     :param color: the color that the agent will choose moves for
     :param threshold: hyper parameter for evaluation function
-    :param warmup: hyper parameter for evaluation function
+    :param warmup: number of random opening moves, used only if there is no opening book
     """
 
     def __init__(self, board, color, game_time=15, threshold=5, warmup=3):
         self.board = board
         self.game_time = game_time
-        self.warmup = warmup
+        self.book = Book.load()  # None if the book file was not built
+        self.warmup = warmup if self.book is None else 0
         self.is_white = True if color == "W" else False  # W->P; B->p
         self.threshold = threshold
+        self.telemetry = None  # called with the statistics of every ply (see Telemetry.record), if set
 
     def ply(self):
         """
@@ -78,73 +267,71 @@ class Agent:
         """
         return (0, 0), (0, 0)
 
+    def book_move(self):
+        """
+        :return: the opening book move of the current position, or None
+        """
+        return None if self.book is None else self.book.lookup(self.board)
+
     def heuristic(self, node):
         if node.is_computed:
             return node.h
+        node.h = self.evaluate_bits(node.white_bits, node.black_bits, node.white_turn)
+        node.is_computed = True
+        return node.h
 
+    def evaluate(self, board):
+        """
+        Static evaluation of a board from the agent's point of view, in [-5000, 5000].
+        """
+        return self.evaluate_bits(board.white_bits, board.black_bits, board.white_turn)
+
+    def evaluate_bits(self, white, black, white_turn):
+        """
+        evaluate on packed boards, e.g. the (white, black) pair of a move. Equal to the original numpy version
+        (Bench.evaluate_numpy), with the precomputed span and distance tables of Board: a few AND operations per pawn.
+        """
         # First option: winning by going straight to the final row
-        idx_w = np.where(node.board.white)
-        white_attackers = np.array([idx_w[0][i] - 1
-                                    if idx_w[0][i] <= 4 and not np.sum(
-            node.board.black[:idx_w[0][i], idx_w[1][i] - 1:idx_w[1][i] + 2]) else 10
-                                    for i in range(len(idx_w[0]))])
-        idx_b = np.where(node.board.black)
-        black_attackers = np.array([8 - idx_b[0][i]
-                                    if idx_b[0][i] >= 5 and not np.sum(
-            node.board.white[idx_b[0][i] + 1:, idx_b[1][i] - 1:idx_b[1][i] + 2]) else 10
-                                    for i in range(len(idx_b[0]))])
-
-        closest_white_dist = np.min(white_attackers) if white_attackers.size != 0 else 10
-        closest_black_dist = np.min(black_attackers) if black_attackers.size != 0 else 10
+        # an attacker is a pawn in the half of the goal with no enemy pawn in its forward span,
+        # pawns are scanned from the closest to the goal
+        closest_white_dist = closest_black_dist = 10
+        candidates = white & Board.WHITE_HALF
+        while candidates:
+            bit = candidates & -candidates
+            square = bit.bit_length() - 1
+            if not black & Board.WHITE_SPAN[square]:
+                closest_white_dist = Board.WHITE_DISTANCE[square]
+                break
+            candidates ^= bit
+        candidates = black & Board.BLACK_HALF
+        while candidates:
+            square = candidates.bit_length() - 1
+            if not white & Board.BLACK_SPAN[square]:
+                closest_black_dist = Board.BLACK_DISTANCE[square]
+                break
+            candidates ^= 1 << square
         if closest_white_dist == closest_black_dist and closest_black_dist != 10:  # look at next step
-            closest_white_dist = closest_white_dist - node.board.white_turn
-            closest_black_dist = closest_black_dist - (not node.board.white_turn)
-        if self.is_white:
-            if closest_white_dist < closest_black_dist:
-                node.h = 1000 * (5 - closest_white_dist)
-                node.is_computed = True
-                return node.h
-            if closest_white_dist > closest_black_dist:
-                node.h = -1000 * (5 - closest_black_dist)
-                node.is_computed = True
-                return node.h
-        else:
-            if closest_white_dist < closest_black_dist:
-                node.h = -1000 * (5 - closest_white_dist)
-                node.is_computed = True
-                return node.h
-            if closest_white_dist > closest_black_dist:
-                node.h = 1000 * (5 - closest_black_dist)
-                node.is_computed = True
-                return node.h
+            closest_white_dist = closest_white_dist - white_turn
+            closest_black_dist = closest_black_dist - (not white_turn)
+        mine, theirs = (closest_white_dist, closest_black_dist) if self.is_white else \
+            (closest_black_dist, closest_white_dist)
+        if mine < theirs:
+            return 1000 * (5 - mine)
+        if mine > theirs:
+            return -1000 * (5 - theirs)
 
         # Second option: winning by disabling the opponent of moving
-        legal_moves = self.threshold if node.board.moves.shape[0] > self.threshold \
-            else node.board.moves.shape[0]
-
-        if self.is_white:
-            if node.board.white_turn:
-                node.h = -5000 * (self.threshold - legal_moves) / self.threshold
-            else:
-                node.h = 5000 * (self.threshold - legal_moves) / self.threshold
-        else:
-            if node.board.white_turn:
-                node.h = 5000 * (self.threshold - legal_moves) / self.threshold
-            else:
-                node.h = -5000 * (self.threshold - legal_moves) / self.threshold
-
-        if node.h != 0:
-            node.is_computed = True
-            return node.h
+        legal_moves = min(self.threshold, Board.count_moves(white, black, white_turn))
+        h = 5000 * (self.threshold - legal_moves) / self.threshold
+        if h != 0:
+            return -h if white_turn == self.is_white else h
 
         # Third option: kill as much pawns as possible
-        if self.is_white:
-            node.h = ((np.sum(node.board.white) - np.sum(node.board.black)) / np.sum(node.board.white)) * 5000
-        else:
-            node.h = ((np.sum(node.board.black) - np.sum(node.board.white)) / np.sum(node.board.black)) * 5000
-
-        node.is_computed = True
-        return node.h
+        white_pawns, black_pawns = Board.popcount(white), Board.popcount(black)
+        my_pawns, their_pawns = (white_pawns, black_pawns) if self.is_white else (black_pawns, white_pawns)
+        if not my_pawns:
+            return float('-inf') if their_pawns else float('nan')
+        return (my_pawns - their_pawns) / my_pawns * 5000
 
 
 class RandomAgent(Agent):
@@ -185,12 +372,12 @@ class MinimaxAgent(Agent):
             return self.heuristic(node)
         if maximizing:
             value = float('-inf')
-            for child_key in node.children:
+            for child_key in self.graph.children(board_key):
                 value = max(value, self.minimax(child_key, False, depth - 1))
             return value
         else:
             value = float('inf')
-            for child_key in node.children:
+            for child_key in self.graph.children(board_key):
                 value = min(value, self.minimax(child_key, True, depth - 1))
             return value
 
@@ -200,17 +387,21 @@ class MinimaxAgent(Agent):
         :return: the action
         """
         start = time.time()
-        if self.warmup > 0:
-            move = random.choice(self.board.moves)
-            san = self.board.make_move(move)
+        move = self.book_move()
+        if move is None and self.warmup > 0:
+            move = random.choice(self.board.move_list)
             self.warmup -= 1
+        if move is not None:
+            san = self.board.make_move(move)
             return "Color:{} ply time:{}".format("White." if self.is_white else "Black.", time.time() - start), san
         best_value = float('-inf')
         best_move = None
-        for count, move in enumerate(self.board.moves):
-            tmp_board = Board.FBoard(white=self.board.white, black=self.board.black, white_turn=self.board.white_turn)
-            tmp_board.make_move(move)
-            value = self.minimax(tmp_board.key())
+        board = Board.FBoard(white=self.board.white_bits, black=self.board.black_bits,
+                             white_turn=self.board.white_turn)
+        for move in board.move_list:
+            undo = board.push(move)
+            value = self.minimax(board.key())
+            board.pop(undo)
             if best_value < value:
                 best_value = value
                 best_move = move
@@ -225,113 +416,434 @@ class AlphaBetaAgent(Agent):
     :param color: the color that the agent will choose moves for
     """
 
-    def __init__(self, board, color, game_time):
+    def __init__(self, board, color, game_time, tt_size=64, orderer=None, workers=1):
         super().__init__(board, color, game_time)
         self.graph = Graph()
+        self.table = TranspositionTable(size_mb=tt_size)
+        self.orderer = MoveOrderer() if orderer is None else orderer
+        self.nodes = 0
+        self.leaves = 0  # evaluated positions
+        self.depth = 0  # plys reached by the last search
+        self.deadline = None  # time.time() after which the running search is aborted
+        # aborts the running search when set
+        self.stop = multiprocessing.Event() if workers > 1 else threading.Event()
+        self.batch_leaves = True  # evaluate the children of depth 1 nodes in one pass, without making their moves
+        self.quiescence_depth = 4  # plys of captures and promotions searched below the horizon, 0 to disable
+        self.pvs = True  # principal variation search, False for a full window on every move
+        self.aspiration = 500  # half width of the aspiration window of iterative deepening, 0 to disable
+        self.symmetry = True  # a position and its mirror image share their transposition table entry
+        # Selective search, each part can be switched off alone. Null move pruning: a node whose side to move
+        # could pass and still reach beta is cut off, after a null window search null_reduction plys shallower.
+        # Passing is not a move, and a pawn without a good move must still play one, so the pruning is skipped
+        # with null_min_moves legal moves or less and a cutoff is verified by a shallower search of the moves.
+        self.null_move = True
+        self.null_reduction = 2
+        self.null_min_moves = 8
+        # late move reductions: quiet moves after the first lmr_moves ones are searched lmr_reduction plys
+        # shallower (from lmr_depth plys), and again at full depth if they beat alpha
+        self.lmr = True
+        self.lmr_moves = 3
+        self.lmr_depth = 3
+        self.lmr_reduction = 1
+        # futility pruning: with futility_depth plys or less left, quiet moves are skipped if the static evaluation
+        # is futility_margin per ply below alpha
+        self.futility = True
+        self.futility_depth = 2
+        self.futility_margin = 1000
+        self.null_cutoffs = 0
+        self.reductions = 0
+        self.futility_prunes = 0
+        self.tablebase = Tablebase.load()  # solved endgames, None if the tablebase file was not built
+        self.tablebase_hits = 0
+        # root moves are split over worker processes if workers > 1
+        self.splitter = RootSplitter(workers, color, tt_size, self.stop) if workers > 1 else None
+
+    def new_search(self):
+        self.table.new_search()
+        self.orderer.new_search()
+        if self.splitter is not None:
+            self.splitter.new_search({key: getattr(self, key) for key in SEARCH_SETTINGS})
+
+    def table_key(self, board):
+        """
+        :return: the transposition table key of a board, and the mask mapping its move codes to the stored ones
+        """
+        if not self.symmetry:
+            return board.hash, 0
+        key, mirrored = board.canonical_hash()
+        return key, Board.MIRROR_CODE if mirrored else 0
 
-    def alphabeta(self, board_key, a=float('-inf'), b=float('inf'), maximizing=True, depth=0):
-        node = self.graph.get_node(board_key)
-        if depth == 0 or node.is_terminal[0]:
-            return self.heuristic(node)
-        if maximizing:
-            value = float('-inf')
-            for child_key in node.children:
-                value = max(value, self.alphabeta(child_key, a=a, b=b, maximizing=False, depth=depth - 1))
-                if value >= b:
-                    break
-                a = max(a, value)
+    def alphabeta(self, board, a=float('-inf'), b=float('inf'), depth=0, ply=1, null=True):
+        """
+        Negamax alpha-beta search with principal variation search: after the first move, the moves are searched
+        with a null window around alpha, and searched again with the full window only if they beat it.
+        Null window nodes may be pruned by a null move or by futility, and late quiet moves are reduced.
+        :param null: False right after a null move, so the side to move does not pass twice in a row
+        :return: the value of the board for the side to move
+        """
+        self.nodes += 1
+        if not self.nodes & 63 and (self.stop.is_set() or self.deadline is not None and time.time() > self.deadline):
+            raise SearchTimeout()
+        a_orig, b_orig = a, b
+        tt_move = NO_MOVE
+        key, code_mask = self.table_key(board)
+        entry = self.table.probe(key)
+        if entry is not None:
+            tt_depth, tt_value, tt_bound, tt_move = entry
+            tt_value = from_table(tt_value, ply)
+            if tt_move != NO_MOVE:
+                tt_move ^= code_mask
+            if tt_depth >= depth:
+                if tt_bound == EXACT:
+                    return tt_value
+                if tt_bound == LOWER:
+                    a = max(a, tt_value)
+                else:
+                    b = min(b, tt_value)
+                if a >= b:
+                    return tt_value
+        if self.tablebase is not None:
+            solved = self.tablebase.probe(board.white_bits, board.black_bits, board.white_turn)
+            if solved is not None:
+                self.tablebase_hits += 1
+                return tablebase_value(solved[0], solved[1], ply)  # the result is for the side to move
+        terminal = board.is_checkmate()[0]
+        if depth == 0 and not terminal and self.quiescence_depth:
+            value = self.quiescence(board, a, b, self.quiescence_depth)
+            self.table.store(key, depth, to_table(value, ply),
+                             UPPER if value <= a_orig else LOWER if value >= b_orig else EXACT)
             return value
-        else:
-            value = float('inf')
-            for child_key in node.children:
-                value = min(value, self.alphabeta(child_key, a=a, b=b, maximizing=True, depth=depth - 1))
-                if value <= a:
-                    break
-                b = min(b, value)
+        if depth == 0 or terminal:
+            self.leaves += 1
+            value = self.evaluate(board) if board.white_turn == self.is_white else -self.evaluate(board)
+            self.table.store(key, depth, to_table(value, ply), EXACT)
             return value
+        pv = b_orig - a_orig > NULL_WINDOW
+        static = None  # static evaluation for the side to move, for the pruning of null window nodes
+        if not pv and (depth >= 2 or depth == 1 and not self.batch_leaves) and \
+                (self.null_move or self.futility and depth <= self.futility_depth):
+            static = self.evaluate(board) if board.white_turn == self.is_white else -self.evaluate(board)
+        if self.null_move and null and static is not None and depth > self.null_reduction and static >= b and \
+                abs(b) < WIN and board.count_moves() > self.null_min_moves:
+            undo = board.push_null()
+            score = -self.alphabeta(board, -b, -b + NULL_WINDOW, depth - 1 - self.null_reduction, ply + 1, False)
+            board.pop(undo)
+            if score >= b:
+                # zugzwang verification: a move of the side to move has to reach beta too
+                score = self.alphabeta(board, b - NULL_WINDOW, b, depth - self.null_reduction, ply, False)
+                if score >= b:
+                    self.null_cutoffs += 1
+                    # the bound comes from the verification search, null_reduction plys shallower
+                    self.table.store(key, depth - self.null_reduction, to_table(score, ply), LOWER)
+                    return score
+        futile = self.futility and static is not None and depth <= self.futility_depth and \
+            static + self.futility_margin * depth <= a and abs(a) < WIN
+        leaves = None
+        if depth == 1 and self.batch_leaves:
+            # the children are leaves, evaluate them in one pass without making their moves
+            moves = board.move_list
+            sign = 1 if board.white_turn == self.is_white else -1
+            leaves = [sign * self.evaluate_bits(white, black, not board.white_turn) for white, black in moves]
+            self.nodes += len(moves)
+            self.leaves += len(moves)
+        else:
+            moves = self.orderer.staged(board, ply, tt_move)
+        value = float('-inf')
+        best_move = None
+        for i, move in enumerate(moves):
+            if leaves is None:
+                quiet = i > 0 and (futile or self.lmr) and board.is_quiet(move)
+                if futile and quiet:
+                    self.futility_prunes += 1
+                    continue
+                undo = board.push(move)
+                if i == 0 or not self.pvs:
+                    score = -self.alphabeta(board, -b, -a, depth - 1, ply + 1)
+                else:
+                    reduction = self.lmr_reduction if self.lmr and quiet and i >= self.lmr_moves and \
+                        depth >= self.lmr_depth else 0
+                    score = -self.alphabeta(board, -a - NULL_WINDOW, -a, depth - 1 - reduction, ply + 1)
+                    if reduction:
+                        self.reductions += 1
+                        if score > a:
+                            score = -self.alphabeta(board, -a - NULL_WINDOW, -a, depth - 1, ply + 1)
+                    if a < score < b:
+                        score = -self.alphabeta(board, -b, -a, depth - 1, ply + 1)
+                board.pop(undo)
+            else:
+                score = leaves[i]
+                # the child stands pat unless it is below alpha and has a noisy move
+                if self.quiescence_depth and score > a and \
+                        Board.has_noisy_moves(move[0], move[1], not board.white_turn):
+                    undo = board.push(move)
+                    score = -self.quiescence(board, -b, -a, self.quiescence_depth, stand_pat=-score)
+                    board.pop(undo)
+            if score > value:
+                value, best_move = score, move
+            if value >= b:
+                # the batched leaves are in generation order, not in search order
+                self.orderer.cutoff(board, move, ply, depth, i if leaves is None else None)
+                break
+            a = max(a, value)
+        if value <= a_orig:
+            bound = UPPER
+        elif value >= b_orig:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, depth, to_table(value, ply), bound,
+                         NO_MOVE if best_move is None else board.move_code(best_move) ^ code_mask)
+        return value
 
-    def ply(self, depth=5, maximizing=True):
+    def quiescence(self, board, a, b, depth, stand_pat=None):
+        """
+        Searches only the captures and the pushes to the last two rows below the horizon, until the position
+        is quiet or for depth plys. The side to move may also stand pat: keep the static evaluation.
+        :param stand_pat: the static evaluation of the board for the side to move, if already known
+        :return: the value of the board for the side to move. The board itself is counted as a node by the caller,
+         alphabeta for a horizon node or the parent's pass over its children.
+        """
+        sign = 1 if board.white_turn == self.is_white else -1
+        if stand_pat is None:
+            self.leaves += 1
+            stand_pat = sign * self.evaluate(board)
+        if depth == 0 or board.white_bits & Board.RANK_8 or board.black_bits & Board.RANK_1:
+            return stand_pat
+        if stand_pat >= b:
+            return stand_pat
+        a = max(a, stand_pat)
+        value = stand_pat
+        moves = board.noisy_moves()
+        if not moves:
+            return value
+        # the children are evaluated in one pass, each one gets its static evaluation as its stand pat
+        scores = [sign * self.evaluate_bits(white, black, not board.white_turn) for white, black in moves]
+        self.nodes += len(moves)
+        self.leaves += len(moves)
+        for move, score in zip(moves, scores):
+            if score > a and depth > 1 and Board.has_noisy_moves(move[0], move[1], not board.white_turn):
+                undo = board.push(move)
+                score = -self.quiescence(board, -b, -a, depth - 1, stand_pat=-score)
+                board.pop(undo)
+            value = max(value, score)
+            if value >= b:
+                break
+            a = max(a, value)
+        return value
+
+    def ply(self, depth=5):
         """
         chooses action using alphabeta pruning
         :return: the action
         """
         start = time.time()
-        if self.warmup > 0:
-            move = random.choice(self.board.moves)
-            san = self.board.make_move(move)
+        before = None if self.telemetry is None else Telemetry.snapshot(self)
+        self.depth = 0  # set by best_move, stays 0 for a book or random move
+        move, source = self.book_move(), "book"
+        if move is None and self.warmup > 0:
+            move, source = random.choice(self.board.move_list), "random"
             self.warmup -= 1
-            return "Color:{} ply time:{}".format("White." if self.is_white else "Black.", time.time() - start), san
+        if move is None:
+            move, source = self.best_move(depth), "search"
+        san = self.board.make_move(move)
+        if before is not None:
+            self.telemetry(Telemetry.record(self, before, source, san))
+        return "Color:{} ply time:{}".format("White." if self.is_white else "Black.", time.time() - start), san
+
+    def best_move(self, depth):
+        self.new_search()
+        self.depth = depth + 1
+        return self.search_root(depth)[1]
+
+    def search_root(self, depth, first=None, board=None, a=float('-inf'), b=float('inf')):
+        """
+        Searches every root move to the given depth, with principal variation search.
+        :param first: a root move to search before the others
+        :param board: root board, the game board by default
+        :param a: lower bound of the search window
+        :param b: upper bound of the search window, the search stops at the first move reaching it
+        :return: the best value and move
+        """
+        board = self.board if board is None else board
+        moves = board.move_list
+        if first is not None:
+            moves = [first] + [move for move in moves if move != first]
+        if self.splitter is not None:
+            best_value, best_move, nodes = self.splitter.search_root(board, moves, depth, self.deadline, a, b)
+            self.nodes += nodes
+            if best_move is None and best_value is None:
+                raise SearchTimeout()
+            return best_value, best_move
         best_value = float('-inf')
         best_move = None
-        for move in self.board.moves:
-            tmp_board = Board.FBoard(white=self.board.white, black=self.board.black, white_turn=self.board.white_turn)
-            tmp_board.make_move(move)
-            value = self.alphabeta(tmp_board.key(), depth=depth, maximizing=not maximizing)
+        # the whole search makes and takes back its moves on this one board
+        board = Board.FBoard(white=board.white_bits, black=board.black_bits, white_turn=board.white_turn)
+        for i, move in enumerate(moves):
+            undo = board.push(move)
+            if i == 0 or not self.pvs:
+                value = -self.alphabeta(board, -b, -a, depth)
+            else:
+                value = -self.alphabeta(board, -a - NULL_WINDOW, -a, depth)
+                if a < value < b:
+                    value = -self.alphabeta(board, -b, -a, depth)
+            board.pop(undo)
             if best_value < value:
                 best_value = value
                 best_move = move
-        san = self.board.make_move(best_move)
-        return "Color:{} ply time:{}".format("White." if self.is_white else "Black.", time.time() - start), san
+            if best_value >= b:
+                break
+            a = max(a, best_value)
+        return best_value, best_move
+
+    def aspiration_search(self, depth, guess, first=None):
+        """
+        search_root in a window of self.aspiration around the value of the former iteration,
+        widened and searched again while the value falls outside of it.
+        :param guess: the value of the former iteration, or None
+        :return: the best value and move
+        """
+        delta = self.aspiration
+        if not delta or guess is None or abs(guess) >= WIN:
+            return self.search_root(depth, first=first)
+        a, b = guess - delta, guess + delta
+        while True:
+            value, move = self.search_root(depth, first=first, a=a, b=b)
+            if value <= a:
+                delta *= 4
+                a = value - delta if delta < WIN else float('-inf')
+            elif value >= b:
+                delta *= 4
+                b = value + delta if delta < WIN else float('inf')
+                first = move
+            else:
+                return value, move
 
 
 class BestAgent(AlphaBetaAgent):
-    def __init__(self, board, color, game_time):
-        super().__init__(board, color, game_time)
+    """
+    Alpha-beta agent with time-budgeted iterative deepening.
+    Every move gets a soft deadline, after which no new iteration is started, and a hard deadline,
+    at which the running iteration is aborted and the best move of the last completed one is played.
+    While the opponent thinks, the agent ponders on its most likely replies.
+    :param ponder: set False to disable pondering
+    :param workers: number of processes searching the root moves
+    """
+
+    def __init__(self, board, color, game_time, ponder=True, workers=1):
+        super().__init__(board, color, game_time, workers=workers)
         self.move_counter = -self.warmup
         # Permanent brain method
-        self.ready = False
+        self.ponder = ponder
+        self.ponder_width = 2  # number of predicted replies to ponder on
+        self.pondered = {}  # hash of a pondered position -> (completed depth, nodes spent)
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        self.ponder_reuse = []  # share of the pondered nodes that the search did not have to redo, per hit
         self.move_time = -1
-        self.search = threading.Thread(target=self.keepSearch, args=(self.board.key(), False))
-        self.ids_consts = (20, 10, 200)
-        self.search.start()
         self.game_time *= 60
-        self.depth = 2
-
-    def keepSearch(self, board_key, maximizing=True, a=float('-inf'), b=float('inf'), depth=200):
-        # node = self.graph.get_node(board_key)
-        # while not self.ready:
-        #     for kid in node.children:
-        #         if self.ready:
-        #             break
-        #         self.graph.get_node(kid)
-        #     node = random.choice(node.children)
-        #     node = self.graph.get_node(node)
-        return
-
-    def depth_scheduler(self):
-        if self.move_counter <= 3:
-            self.depth = 2
-        elif self.move_counter == 4:
-            self.depth = 3
-        else:
-            ratio = self.move_time / self.game_time
-            if ratio >= 0.25:
-                self.depth -= 1
-            if 0.1 <= ratio:
-                return self.depth
-            elif 0.05 <= ratio:
-                self.depth += 1
-            else:
-                if self.move_counter <= 15:
-                    self.depth += 2
-                else:
-                    self.depth += 3
-        self.depth = min(20, self.depth)
-        return self.depth
+        # Time management: the clock is split over moves_to_go moves, the hard deadline is hard_factor times
+        # the soft one (at most a quarter of the clock).
+        self.moves_to_go = 30
+        self.hard_factor = 3
+        self.stable_iterations = 6  # stop when the best move did not change for that many iterations
+        self.time_share = 1.0  # share of the move budget to use, lowered by a server with more searches than processes
+        self.max_depth = 100
+        self.search = threading.Thread(target=self.keepSearch, args=(self.board.key(),), daemon=True)
+        self.search.start()
 
-    def ply(self, depth=3, maximizing=True):  # depth is used only by base class
-        self.depth_scheduler()
+    def keepSearch(self, board_key):
+        """
+        Ponders on the opponent's time: searches the positions after the most likely replies (the transposition
+        table move first) into the shared transposition table, until ply() sets the stop signal.
+        """
+        board = Board.FBoard(white=board_key[0], black=board_key[1], white_turn=board_key[2])
+        self.pondered = {}
+        if not self.ponder or board.white_turn == self.is_white or board.is_checkmate()[0]:
+            return
+        key, code_mask = self.table_key(board)
+        entry = self.table.probe(key)
+        replies = self.orderer.order(board, board.move_list, 0,
+                                     NO_MOVE if entry is None or entry[3] == NO_MOVE else entry[3] ^ code_mask)
+        positions = []
+        for reply in replies[:self.ponder_width]:
+            position = board.copy()
+            position.make_move(reply)
+            if not position.is_checkmate()[0]:
+                positions.append([position, None, 0])  # board, best move, nodes spent
+        try:
+            # deepen all the predicted positions together, the most likely one first at every depth
+            for depth in range(self.max_depth):
+                solved = []
+                for pondering in positions:
+                    position, best_move, spent = pondering
+                    nodes = self.nodes
+                    value, pondering[1] = self.search_root(depth, first=best_move, board=position)
+                    pondering[2] += self.nodes - nodes
+                    self.pondered[position.hash] = (depth + 1, pondering[2])
+                    if abs(value) >= WIN:
+                        solved.append(pondering)
+                positions = [pondering for pondering in positions if pondering not in solved]
+                if not positions:
+                    return
+        except SearchTimeout:
+            return
+
+    def ponder_report(self):
+        reuse = sum(self.ponder_reuse) / len(self.ponder_reuse) if self.ponder_reuse else 0.0
+        return "ponder hits:{}/{} reused:{:.1%}".format(self.ponder_hits, self.ponder_hits + self.ponder_misses, reuse)
+
+    def deadlines(self, start):
+        """
+        :return: soft and hard deadlines of the current move
+        """
+        budget = self.time_share * self.game_time / max(10, self.moves_to_go - self.move_counter)
+        return start + budget, start + min(budget * self.hard_factor, self.game_time / 4)
+
+    def best_move(self, depth=None):
+        """
+        Iterative deepening from the root until a deadline passes, the best move is stable or a win is found.
+        """
+        start = time.time()
+        soft, self.deadline = self.deadlines(start)
+        self.new_search()
+        pondered = self.pondered.get(self.board.hash)
+        if pondered is None:
+            self.ponder_misses += 1
+        else:
+            self.ponder_hits += 1
+        nodes = self.nodes
+        best_value, best_move = float('-inf'), None
+        stable = 0
+        for depth in range(self.max_depth):
+            try:
+                value, move = self.aspiration_search(depth, None if best_move is None else best_value, first=best_move)
+            except SearchTimeout:
+                break
+            stable = stable + 1 if move == best_move else 0
+            best_value, best_move = value, move
+            self.depth = depth + 1
+            if pondered is not None and self.depth == pondered[0]:
+                self.ponder_reuse.append(1 - (self.nodes - nodes) / max(1, pondered[1]))
+            if best_value >= WIN or stable >= self.stable_iterations or time.time() > soft:
+                break
+        self.deadline = None
+        return self.board.move_list[0] if best_move is None else best_move
+
+    def ply(self, depth=3):  # depth is used only by base class
         start = time.time()
-        self.ready = True
+        self.stop.set()
         self.search.join()
-        print("{} player will search at depth {}".format("White" if self.is_white else "Black", self.depth))
-        san = super().ply(depth=self.depth, maximizing=maximizing)[1]
+        self.stop.clear()
+        san = super().ply(depth=depth)[1]
+        # on stderr, stdout may carry the telemetry
+        print("{} player searched to depth {}, {}, {}".format("White" if self.is_white else "Black", self.depth,
+                                                              self.orderer.report(), self.ponder_report()),
+              file=sys.stderr)
         self.move_counter += 1
-        self.search = threading.Thread(target=self.keepSearch, args=(self.board.key(), False))
+        self.search = threading.Thread(target=self.keepSearch, args=(self.board.key(),), daemon=True)
         self.move_time = time.time() - start
         self.game_time -= self.move_time
         self.search.start()
-        self.ready = False
 
         return "Color:{} ply time:{}".format("White." if self.is_white else "Black.", time.time() - start), san
 
@@ -342,7 +854,7 @@ class BestAgent(AlphaBetaAgent):
             return num_moves, num_of_boards
         node = self.graph.get_node(self.board.key())
         average = num_moves
-        children = node.children
+        children = self.graph.children(self.board.key())
         tmp_board = self.board
         for child in children:
             child = self.graph.get_node(child)
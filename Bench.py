@@ -0,0 +1,696 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import sys
+import time
+import tracemalloc
+
+import chess
+import numpy as np
+
+import Agents
+import Board
+import Protocol
+import Server
+import Tablebase
+
+START_FEN = '8/pppppppp/8/8/8/8/PPPPPPPP/8'
+# perft positions, a FEN may end with the side to move (w or b)
+PERFT_FENS = [
+    START_FEN,
+    START_FEN + ' b',
+    '8/p6p/1P4P1/8/8/1p4p1/P6P/8',  # captures on the edge files, where a shift could wrap to the next row
+    '8/pppppppp/P7/8/8/7p/PPPPPPPP/8',  # pushes blocked on the first step
+    '8/pppppppp/8/P7/7p/8/PPPPPPPP/8 b',  # double pushes blocked on the second step only
+    '8/1P4p1/8/2p5/5P2/8/1p4P1/8',  # promotions on the next move
+    '8/ppp2ppp/3pp3/3PP3/8/8/PPP2PPP/8',  # locked center
+    '8/2p1p3/8/3P4/8/8/8/8 b',  # double pushes that would allow en passant in chess
+    '8/8/8/p7/P7/8/8/8',  # the side to move has no move
+]
+# client moves the boards must reject, though a sloppy parser would read a legal move in them
+MALFORMED_MOVES = ['i3i4',  # off the board, read as a2a3 if the file is not checked
+                   'a2a3extra',  # trailing garbage
+                   'a2a3n', 'a0a1', 'a2a']
+
+
+def walk(board, depth):
+    """
+    Counts the positions reached by playing every legal move up to depth plys (the root included).
+    """
+    if depth == 0 or board.is_checkmate()[0]:
+        return 1
+    count = 1
+    for move in board.moves:
+        child = board.copy()
+        child.make_move(move)
+        count += walk(child, depth - 1)
+    return count
+
+
+def walk_copies(board, depth):
+    """
+    walk on a copied board per position, as the search did before push/pop.
+    """
+    if depth == 0 or board.is_checkmate()[0]:
+        return 1
+    count = 1
+    for move in board.move_list:
+        child = board.copy()
+        child.make_move(move, check=False)
+        count += walk_copies(child, depth - 1)
+    return count
+
+
+def walk_inplace(board, depth):
+    """
+    walk on a single board, making and taking back the moves in place.
+    """
+    if depth == 0 or board.is_checkmate()[0]:
+        return 1
+    count = 1
+    for move in board.move_list:
+        undo = board.push(move)
+        count += walk_inplace(board, depth - 1)
+        board.pop(undo)
+    return count
+
+
+def perft(board, depth):
+    """
+    Counts the move sequences of depth plys from an FBoard (the leaves of the perft tree), on push/pop
+    and with the moves of the last ply counted without generating them.
+    A finished game has no moves.
+    """
+    if depth == 0:
+        return 1
+    if board.white_bits & Board.RANK_8 or board.black_bits & Board.RANK_1:
+        return 0
+    if depth == 1:
+        return board.count_moves()
+    nodes = 0
+    for move in board.move_list:
+        undo = board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop(undo)
+    return nodes
+
+
+def perft_copies(board, depth):
+    """
+    perft on board copies, for the NumpyBoard and GameBoard, which have no push/pop.
+    """
+    if depth == 0:
+        return 1
+    if board.is_checkmate()[0]:
+        return 0
+    nodes = 0
+    for move in list(board.moves):
+        child = board.copy()
+        child.make_move(move)
+        nodes += perft_copies(child, depth - 1)
+    return nodes
+
+
+def perft_chess(board, depth):
+    """
+    Reference perft on python-chess: only queen promotions, which end the game, and no en passant,
+    which the game does not have.
+    """
+    if depth == 0:
+        return 1
+    if board.queens:
+        return 0
+    moves = [move for move in board.legal_moves
+             if move.promotion in (None, chess.QUEEN) and not board.is_en_passant(move)]
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.push(move)
+        nodes += perft_chess(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def perft_board(name, fen, white_turn):
+    white, black = Board.fen2bits(fen)
+    if name == "packed":
+        return Board.FBoard(white=white, black=black, white_turn=white_turn)
+    if name == "numpy":
+        return Board.NumpyBoard(white=Board.to_array(white), black=Board.to_array(black), white_turn=white_turn)
+    return Board.GameBoard(fen=fen, white_turn=white_turn)
+
+
+def bench_perft(args):
+    """
+    perft of every board implementation on the perft positions (or on --fen), checked against python-chess,
+    then the parsing of malformed client moves. Prints one JSON line per position, board and depth, and one per
+    board for the parsing, and fails if a count differs or a malformed move is accepted.
+    """
+    fens = PERFT_FENS if args.fen == START_FEN else [args.fen]
+    failed = False
+    for fen in fens:
+        placement, _, turn = fen.partition(' ')
+        white_turn = turn != 'b'
+        reference = chess.Board("{} {} - - 0 1".format(placement, 'w' if white_turn else 'b'))
+        for depth in range(1, args.depth + 1):
+            expected = perft_chess(reference, depth)
+            for name in args.boards:
+                board = perft_board(name, placement, white_turn)
+                start = time.time()
+                nodes = perft(board, depth) if name == "packed" else perft_copies(board, depth)
+                elapsed = time.time() - start
+                failed |= nodes != expected
+                print(json.dumps({"fen": fen, "board": name, "depth": depth, "nodes": nodes, "expected": expected,
+                                  "ok": nodes == expected, "seconds": round(elapsed, 6),
+                                  "nps": round(nodes / elapsed) if elapsed else None}), flush=True)
+    for name in args.boards:
+        if name == "numpy":
+            continue
+        board = perft_board(name, START_FEN, True)
+        accepted = [move for move in MALFORMED_MOVES if board.parse_uci(move) is not None]
+        failed |= bool(accepted)
+        print(json.dumps({"board": name, "malformed_moves": len(MALFORMED_MOVES), "accepted": accepted,
+                          "ok": not accepted}), flush=True)
+    if failed:
+        sys.exit(1)
+
+
+def bench_movegen(args):
+    """
+    Positions per second of the packed FBoard against the numpy NumpyBoard, on a full tree walk.
+    """
+    white, black = Board.fen2bits(args.fen)
+    boards = {"numpy": Board.NumpyBoard(white=Board.to_array(white), black=Board.to_array(black)),
+              "packed": Board.FBoard(white=white, black=black)}
+    rates = {}
+    for name, board in boards.items():
+        start = time.time()
+        positions = walk(board, args.depth)
+        elapsed = time.time() - start
+        rates[name] = positions / elapsed
+        print("{:>8}: {} positions in {:.3f}s, {:.0f} positions/s".format(name, positions, elapsed, rates[name]))
+    print("speedup: {:.1f}x".format(rates["packed"] / rates["numpy"]))
+
+
+def bench_parallel(args):
+    """
+    Time to depth of the root-split search for every number of workers.
+    """
+    white, black = Board.fen2bits(args.fen)
+    baseline = None
+    for workers in args.workers:
+        agent = Agents.AlphaBetaAgent(Board.FBoard(white=white, black=black), "W", 0, workers=workers)
+        agent.new_search()
+        start = time.time()
+        best_move = None
+        for depth in range(args.depth):
+            value, best_move = agent.search_root(depth, first=best_move)
+        elapsed = time.time() - start
+        baseline = elapsed if baseline is None else baseline
+        print("workers:{:>3} depth:{} time:{:.3f}s speedup:{:.2f}x nodes:{} value:{} move:{}".format(
+            workers, args.depth, elapsed, baseline / elapsed, agent.nodes, value,
+            agent.board.move_uci(best_move)))
+        if agent.splitter is not None:
+            agent.splitter.close()
+
+
+def bench_makemove(args):
+    """
+    Nodes per second of a tree walk on board copies against make/unmake on one board.
+    """
+    white, black = Board.fen2bits(args.fen)
+    rates = {}
+    for name, walker in (("copy", walk_copies), ("push/pop", walk_inplace)):
+        start = time.time()
+        nodes = walker(Board.FBoard(white=white, black=black), args.depth)
+        elapsed = time.time() - start
+        rates[name] = nodes / elapsed
+        print("{:>8}: {} nodes in {:.3f}s, {:.0f} nodes/s".format(name, nodes, elapsed, rates[name]))
+    print("speedup: {:.1f}x".format(rates["push/pop"] / rates["copy"]))
+
+
+def bench_batchmoves(args):
+    """
+    Positions per second of Board.moves_batch on a stack of random positions against FBoard in a loop,
+    checking that both give the same moves.
+    """
+    positions = sample_positions(args.positions, plys=12)
+    boards = np.array([(board.white_bits, board.black_bits) for board in positions], dtype=np.uint64)
+    turns = np.array([board.white_turn for board in positions])
+    start = time.time()
+    lists = [Board.FBoard(white=int(white), black=int(black), white_turn=bool(turn)).move_list
+             for (white, black), turn in zip(boards, turns)]
+    looped = time.time() - start
+    start = time.time()
+    successors, offsets, parents = Board.moves_batch(boards, turns)
+    batched = time.time() - start
+    mismatches = sum(1 for i, moves in enumerate(lists)
+                     if successors[offsets[i]:offsets[i + 1]].tolist() != [list(move) for move in moves])
+    print("positions:{} successors:{} FBoard loop: {:.0f} positions/s, moves_batch: {:.0f} positions/s, "
+          "speedup: {:.1f}x, mismatches: {}".format(len(positions), len(successors), len(positions) / looped,
+                                                   len(positions) / batched, looped / batched, mismatches))
+    if mismatches:
+        sys.exit(1)
+
+
+def sample_positions(count, plys=10, seed=0):
+    """
+    Random positions after plys random moves from the start position (or earlier if the game ended).
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = Board.FBoard(white=Board.fen2bits(START_FEN)[0], black=Board.fen2bits(START_FEN)[1])
+        for _ in range(plys):
+            if board.is_checkmate()[0]:
+                break
+            board.make_move(rng.choice(board.move_list))
+        if not board.is_checkmate()[0]:
+            positions.append(board)
+    return positions
+
+
+def bench_graph(args):
+    """
+    Memory of the minimax search graph: explores every position to --depth plys from --fen, evaluating the
+    leaves, and reports the bytes per node (the node, its position, its edges and its entry in the graph's dict)
+    and the number of nodes that fit in --ram megabytes.
+    """
+    white, black = Board.fen2bits(args.fen)
+    agent = Agents.Agent(None, "W")
+    graph = Agents.Graph()
+    tracemalloc.start()
+    start = time.time()
+    frontier = {Board.zobrist(white, black, True): (white, black, True)}
+    graph.get_node((white, black, True))
+    for _ in range(args.depth):
+        children = {}
+        for key in frontier:
+            for child_key in graph.children(key):
+                children[child_key] = child_key
+        frontier = children
+    for key in frontier:
+        agent.heuristic(graph.get_node(key))
+    elapsed = time.time() - start
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = len(graph.graph)
+    print(json.dumps({"depth": args.depth, "nodes": nodes, "seconds": round(elapsed, 3),
+                      "bytes_per_node": round(used / nodes, 1),
+                      "nodes_in_budget": int(args.ram * 2 ** 20 * nodes / used), "ram_mb": args.ram}))
+
+
+def evaluate_numpy(agent, board):
+    """
+    The original Agent.evaluate of an agent on the padded arrays, kept as a reference for benchmarks and
+    cross-checks.
+    """
+    white, black = board.white, board.black
+    # First option: winning by going straight to the final row
+    idx_w = np.where(white)
+    white_attackers = np.array([idx_w[0][i] - 1
+                                if idx_w[0][i] <= 4 and not np.sum(
+        black[:idx_w[0][i], idx_w[1][i] - 1:idx_w[1][i] + 2]) else 10
+                                for i in range(len(idx_w[0]))])
+    idx_b = np.where(black)
+    black_attackers = np.array([8 - idx_b[0][i]
+                                if idx_b[0][i] >= 5 and not np.sum(
+        white[idx_b[0][i] + 1:, idx_b[1][i] - 1:idx_b[1][i] + 2]) else 10
+                                for i in range(len(idx_b[0]))])
+
+    closest_white_dist = np.min(white_attackers) if white_attackers.size != 0 else 10
+    closest_black_dist = np.min(black_attackers) if black_attackers.size != 0 else 10
+    if closest_white_dist == closest_black_dist and closest_black_dist != 10:  # look at next step
+        closest_white_dist = closest_white_dist - board.white_turn
+        closest_black_dist = closest_black_dist - (not board.white_turn)
+    if agent.is_white:
+        if closest_white_dist < closest_black_dist:
+            return 1000 * (5 - closest_white_dist)
+        if closest_white_dist > closest_black_dist:
+            return -1000 * (5 - closest_black_dist)
+    else:
+        if closest_white_dist < closest_black_dist:
+            return -1000 * (5 - closest_white_dist)
+        if closest_white_dist > closest_black_dist:
+            return 1000 * (5 - closest_black_dist)
+
+    # Second option: winning by disabling the opponent of moving
+    legal_moves = min(agent.threshold, board.count_moves())
+
+    if agent.is_white:
+        if board.white_turn:
+            h = -5000 * (agent.threshold - legal_moves) / agent.threshold
+        else:
+            h = 5000 * (agent.threshold - legal_moves) / agent.threshold
+    else:
+        if board.white_turn:
+            h = 5000 * (agent.threshold - legal_moves) / agent.threshold
+        else:
+            h = -5000 * (agent.threshold - legal_moves) / agent.threshold
+
+    if h != 0:
+        return h
+
+    # Third option: kill as much pawns as possible
+    if agent.is_white:
+        return ((np.sum(white) - np.sum(black)) / np.sum(white)) * 5000
+    else:
+        return ((np.sum(black) - np.sum(white)) / np.sum(black)) * 5000
+
+
+def bench_evaluate(args):
+    """
+    Leaf evaluations per second of Agent.evaluate on every child (including the child board the search builds
+    for it) against Agents.evaluate_batch on all the children of a position at once.
+    """
+    agent = Agents.Agent(None, "W")
+    parents = sample_positions(args.positions)
+    start = time.time()
+    leaves = 0
+    for board in parents:
+        for move in board.move_list:
+            child = board.copy()
+            child.make_move(move)
+            agent.evaluate(child)
+            leaves += 1
+    per_node = leaves / (time.time() - start)
+    start = time.time()
+    for board in parents:
+        Agents.evaluate_batch(agent, np.array(board.move_list, dtype=np.uint64), not board.white_turn)
+    batched = leaves / (time.time() - start)
+    print("per node: {:.0f} leaves/s, batched: {:.0f} leaves/s, speedup: {:.1f}x".format(
+        per_node, batched, batched / per_node))
+
+
+def bench_heuristic(args):
+    """
+    Agent.evaluate on the packed boards and precomputed tables against the original evaluate_numpy,
+    on random midgame positions. Exits with status 1 if they disagree on a position.
+    """
+    agents = [Agents.Agent(None, "W"), Agents.Agent(None, "B")]
+    positions = sample_positions(args.positions, plys=16)
+    rates = {}
+    for name, evaluate in (("evaluate_numpy", evaluate_numpy), ("evaluate", Agents.Agent.evaluate)):
+        start = time.time()
+        for agent in agents:
+            for board in positions:
+                evaluate(agent, board)
+        rates[name] = 2 * len(positions) / (time.time() - start)
+    mismatches = sum(1 for agent in agents for board in positions
+                     if agent.evaluate(board) != evaluate_numpy(agent, board))
+    print("numpy: {:.0f} evals/s, tables: {:.0f} evals/s, speedup: {:.1f}x, mismatches: {}".format(
+        rates["evaluate_numpy"], rates["evaluate"], rates["evaluate"] / rates["evaluate_numpy"], mismatches))
+    if mismatches:
+        sys.exit(1)
+
+
+def deepening(board, plys, **settings):
+    """
+    Iterative deepening, with aspiration windows, of a fresh agent from 1 to plys plys.
+    :param settings: attributes to set on the agent
+    :return: the best move, and the total number of nodes and seconds, after every iteration
+    """
+    agent = Agents.AlphaBetaAgent(board, "W" if board.white_turn else "B", 0)
+    for key, value in settings.items():
+        setattr(agent, key, value)
+    agent.new_search()
+    moves, nodes, times = [], [], []
+    value, move = None, None
+    start = time.time()
+    for depth in range(plys):
+        value, move = agent.aspiration_search(depth, value, first=move)
+        moves.append(move)
+        nodes.append(agent.nodes)
+        times.append(time.time() - start)
+    return moves, nodes, times
+
+
+def bench_quiescence(args):
+    """
+    Depth saved by quiescence search for the same tactical accuracy. The test positions are sampled positions
+    where the side to move can capture and a 1 ply search misses the move of a reference search without
+    quiescence, args.depth + 2 plys deep. A setting solves a position at the smallest depth from which
+    iterative deepening keeps playing the reference move, up to args.depth plys.
+    Use a small --positions, e.g. 20.
+    """
+    settings = {"plain": 0, "quiescence": args.quiescence}
+    results = {name: [] for name in settings}
+    positions = 0
+    for board in sample_positions(50 * args.positions, plys=14):
+        if positions == args.positions:
+            break
+        if not board.captures():
+            continue
+        first = deepening(board, 1, quiescence_depth=0)[0][0]
+        reference = deepening(board, args.depth + 2, quiescence_depth=0)[0][-1]
+        if first == reference:
+            continue
+        positions += 1
+        for name, quiescence_depth in settings.items():
+            moves, nodes, times = deepening(board, args.depth, quiescence_depth=quiescence_depth)
+            solved = next((depth for depth in range(args.depth) if all(move == reference for move in moves[depth:])),
+                          None)
+            results[name].append((solved, None) if solved is None else (solved, nodes[solved], times[solved]))
+    for name, solved in results.items():
+        solved = [result for result in solved if result[0] is not None]
+        count = max(1, len(solved))
+        print("{:>10}: solved {}/{}, mean depth {:.2f} plys, mean nodes to solve {:.0f}, mean time to solve {:.3f}s"
+              .format(name, len(solved), positions, sum(depth + 1 for depth, _, _ in solved) / count,
+                      sum(nodes for _, nodes, _ in solved) / count, sum(seconds for _, _, seconds in solved) / count))
+    both = [(plain[0], quiet[0]) for plain, quiet in zip(results["plain"], results["quiescence"])
+            if plain[0] is not None and quiet[0] is not None]
+    if both:
+        print("depth saved on the positions both solve: {:.2f} plys".format(
+            sum(plain - quiet for plain, quiet in both) / len(both)))
+
+
+def bench_search(args):
+    """
+    Nodes and time of iterative deepening to args.depth plys on sampled positions, for full window alpha-beta,
+    principal variation search and principal variation search with aspiration windows.
+    """
+    settings = {"alpha-beta": {"pvs": False, "aspiration": 0}, "pvs": {"pvs": True, "aspiration": 0},
+                "pvs+aspiration": {"pvs": True, "aspiration": 500}}
+    positions = sample_positions(args.positions, plys=12)
+    baseline = None
+    for name, attributes in settings.items():
+        nodes, seconds = 0, 0.0
+        for board in positions:
+            result = deepening(board, args.depth, **attributes)
+            nodes += result[1][-1]
+            seconds += result[2][-1]
+        baseline = nodes if baseline is None else baseline
+        print("{:>15}: {} nodes ({:.0%}), {:.2f}s".format(name, nodes, nodes / baseline, seconds))
+
+
+def timed_depth(board, seconds, **settings):
+    """
+    :return: the depth iterative deepening of a fresh agent completes in seconds
+    """
+    agent = Agents.AlphaBetaAgent(board, "W" if board.white_turn else "B", 0)
+    for key, value in settings.items():
+        setattr(agent, key, value)
+    agent.new_search()
+    agent.deadline = time.time() + seconds
+    value, move = None, None
+    for depth in range(100):
+        try:
+            value, move = agent.aspiration_search(depth, value, first=move)
+        except Agents.SearchTimeout:
+            return depth
+        if abs(value) >= Agents.WIN:
+            return depth + 1
+    return 100
+
+
+def bench_selective(args):
+    """
+    The parts of the selective search (null move pruning, late move reductions, futility pruning) one at a time
+    and together, against the full width search, on sampled positions: nodes and time of iterative deepening to
+    --depth plys, how often the best move is the full width one, and the mean depth completed in --budget seconds.
+    """
+    full_width = {"null_move": False, "lmr": False, "futility": False}
+    settings = {"full width": full_width, "null move": dict(full_width, null_move=True),
+                "lmr": dict(full_width, lmr=True), "futility": dict(full_width, futility=True), "all": {}}
+    positions = sample_positions(args.positions, plys=12)
+    reference = None
+    for name, attributes in settings.items():
+        nodes, seconds, moves = 0, 0.0, []
+        for board in positions:
+            result = deepening(board, args.depth, **attributes)
+            moves.append(result[0][-1])
+            nodes += result[1][-1]
+            seconds += result[2][-1]
+        reference = moves if reference is None else reference
+        depth = sum(timed_depth(board, args.budget, **attributes) for board in positions) / len(positions)
+        print(json.dumps({"search": name, "nodes": nodes, "seconds": round(seconds, 2),
+                          "same_move": round(sum(a == b for a, b in zip(moves, reference)) / len(moves), 3),
+                          "depth_in_budget": round(depth, 2)}))
+
+
+def bench_symmetry(args):
+    """
+    Transposition tables with and without the mirror images of the positions sharing their entries
+    (AlphaBetaAgent.symmetry): nodes of a --depth plys search of --fen, whose mirror image moves lead to the same
+    positions if it is symmetric, then on alpha-beta self-play games from --openings random openings, searched to
+    --depth plys: hit rate, and the entries stored per thousand searched nodes.
+    """
+    openings = sample_positions(args.openings, plys=4)
+    white, black = Board.fen2bits(args.fen)
+    for symmetry in (False, True):
+        agent = Agents.AlphaBetaAgent(Board.FBoard(white=white, black=black), "W", 0, tt_size=16)
+        agent.symmetry = symmetry
+        agent.best_move(args.depth)
+        root_nodes = agent.nodes
+        probes = hits = stored = nodes = plys = 0
+        start = time.time()
+        for opening in openings:
+            board = opening.copy()
+            agents = {}
+            for color in ("W", "B"):
+                agents[color == "W"] = Agents.AlphaBetaAgent(board, color, 0, tt_size=16)
+                agents[color == "W"].symmetry = symmetry
+            while plys < 100 * args.openings and not board.is_checkmate()[0]:
+                board.make_move(agents[board.white_turn].best_move(args.depth))
+                plys += 1
+            for agent in agents.values():
+                probes += agent.table.probes
+                hits += agent.table.hits
+                nodes += agent.nodes
+                stored += sum(1 for depth in agent.table.depths if depth >= 0)
+        print(json.dumps({"symmetry": symmetry, "root_nodes": root_nodes, "games": len(openings), "plys": plys,
+                          "nodes": nodes, "seconds": round(time.time() - start, 2), "tt_probes": probes,
+                          "tt_hit_rate": round(hits / probes, 4), "tt_entries": stored,
+                          "tt_entries_per_knode": round(1000 * stored / nodes, 1)}))
+
+
+def bench_tablebase(args):
+    """
+    Generation time of a tablebase, and probe latency on positions inside it and on midgame positions
+    the probe rejects.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "bench.tb")
+    start = time.time()
+    solved = Tablebase.build(args.pawns, path)
+    elapsed = time.time() - start
+    print("build: {} positions in {:.1f}s, {:.0f} positions/s, {} bytes".format(
+        solved, elapsed, solved / elapsed, os.path.getsize(path)))
+    tablebase = Tablebase.Tablebase(path)
+    rng = random.Random(0)
+    endgames = []
+    while len(endgames) < args.positions:
+        squares = rng.sample(range(Tablebase.FIRST_SQUARE, Tablebase.FIRST_SQUARE + Tablebase.SQUARES), 2 * args.pawns)
+        white = sum(1 << sq for sq in squares[:rng.randint(1, args.pawns)])
+        black = sum(1 << sq for sq in squares[args.pawns:args.pawns + rng.randint(1, args.pawns)])
+        endgames.append((white, black, rng.random() < 0.5))
+    midgames = [board.key() for board in sample_positions(args.positions)]
+    for name, positions in (("endgame", endgames), ("midgame", midgames)):
+        start = time.time()
+        for white, black, white_turn in positions:
+            tablebase.probe(white, black, white_turn)
+        print("probe {}: {:.2f}us".format(name, (time.time() - start) / len(positions) * 1e6))
+    os.remove(path)
+
+
+async def server_client(port, moves, rng):
+    """
+    Client of bench_server: plays random moves as White and disconnects after moves replies of the engine.
+    :return: the seconds between each move and the reply
+    """
+    connection = await Protocol.Connection.open('localhost', port)
+    latencies = []
+    try:
+        _, fen, _, _ = await Protocol.handshake(connection)
+        white, black = Board.fen2bits(fen)
+        board = Board.FBoard(white=white, black=black)
+        while len(latencies) < moves and not board.is_checkmate()[0]:
+            move = rng.choice(board.move_list)
+            text = board.move_uci(move)
+            board.make_move(move)
+            sent = time.time()
+            await connection.send(text)
+            if board.is_checkmate()[0]:
+                break
+            reply = board.parse_uci(await connection.receive())
+            latencies.append(time.time() - sent)
+            board.make_move(reply)
+    finally:
+        await connection.close()
+    return latencies
+
+
+def bench_server(args):
+    """
+    Throughput and per-move latency of the engine server with 1, 10 and 100 (--games) games at once, each one
+    against a random client, all the searches on --processes processes.
+    """
+    async def run(games):
+        engine = Server.EngineServer(args.agent, 1, START_FEN, "W", args.processes)
+        server = await engine.serve('localhost', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            start = time.time()
+            results = await asyncio.gather(*[server_client(port, args.moves, random.Random(game))
+                                             for game in range(games)])
+            elapsed = time.time() - start
+            while len(engine.games) < games:  # the sessions end once they read the disconnections
+                await asyncio.sleep(0.01)
+        finally:
+            server.close()
+            engine.scheduler.shutdown()
+        latencies = sorted(latency for result in results for latency in result)
+        return {"games": games, "processes": engine.scheduler.processes, "moves": len(latencies),
+                "seconds": round(elapsed, 3), "moves_per_second": round(len(latencies) / elapsed, 2),
+                "latency_median": round(latencies[len(latencies) // 2], 4),
+                "latency_p95": round(latencies[int(len(latencies) * 0.95)], 4),
+                "latency_max": round(latencies[-1], 4)}
+
+    for games in args.games:
+        print(json.dumps(asyncio.run(run(games))))
+
+
+benchmarks = {"movegen": bench_movegen, "parallel": bench_parallel, "evaluate": bench_evaluate,
+              "makemove": bench_makemove, "tablebase": bench_tablebase, "perft": bench_perft,
+              "quiescence": bench_quiescence, "search": bench_search, "heuristic": bench_heuristic,
+              "server": bench_server, "batchmoves": bench_batchmoves, "graph": bench_graph,
+              "symmetry": bench_symmetry, "selective": bench_selective}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", type=str, choices=sorted(benchmarks),
+                        help="benchmark to run")
+    parser.add_argument("--depth", type=int, default=4,
+                        help="search depth in plys")
+    parser.add_argument("--fen", type=str, default=START_FEN,
+                        help="start position")
+    parser.add_argument("--positions", type=int, default=500,
+                        help="number of sampled positions")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="numbers of search processes to compare")
+    parser.add_argument("--pawns", type=int, default=2,
+                        help="maximal number of pawns per side of the tablebase")
+    parser.add_argument("--quiescence", type=int, default=4,
+                        help="quiescence depth limit in plys")
+    parser.add_argument("--boards", type=str, nargs="+", default=["packed", "numpy"],
+                        choices=["packed", "numpy", "game"],
+                        help="board implementations to run perft on")
+    parser.add_argument("--games", type=int, nargs="+", default=[1, 10, 100],
+                        help="numbers of concurrent games of the server benchmark")
+    parser.add_argument("--moves", type=int, default=10,
+                        help="engine moves per game of the server benchmark")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="search processes of the server benchmark")
+    parser.add_argument("--agent", type=str, default="best:moves_to_go=300",
+                        help="agent spec of the server benchmark, the clock is 1 minute per game")
+    parser.add_argument("--ram", type=int, default=1024,
+                        help="memory budget of the graph benchmark, in megabytes")
+    parser.add_argument("--openings", type=int, default=10,
+                        help="number of random openings of the self-play games")
+    parser.add_argument("--budget", type=float, default=0.5,
+                        help="search time per position of the selective search benchmark, in seconds")
+    args = parser.parse_args()
+    benchmarks[args.benchmark](args)
@@ -1,11 +1,608 @@
-import chess
 import numpy as np
-import chess.svg
+import random
 import re
 import copy
 
+# Packed bitboards: each side is one python int, bit (row - 1) * 8 + (col - 1) holds the padded
+# board cell [row, col]. Bit 0 is a8 and bit 63 is h1, so white moves towards bit 0 (right shifts)
+# and black moves towards bit 63 (left shifts).
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+RANK_8 = 0xFF  # white wins here
+RANK_6 = 0xFF << 16  # black single pushes from the initial row land here
+RANK_3 = 0xFF << 40  # white single pushes from the initial row land here
+RANK_1 = 0xFF << 56  # black wins here
+WHITE_PROMOTION = RANK_8 | RANK_8 << 8  # the last two rows of each side
+BLACK_PROMOTION = RANK_1 | RANK_1 >> 8
+WHITE_HALF = (1 << 32) - 1  # rows 1..4, where the heuristic looks for white attackers
+BLACK_HALF = FULL ^ WHITE_HALF
+FILES = 'abcdefgh'  # square names, as in UCI moves
+RANKS = '12345678'
+
+
+def _forward_span(square, step):
+    '''
+    Method returns the squares ahead of a pawn (towards row 0 if step is -1, row 7 if step is 1),
+    on its own and the two adjacent files.
+    '''
+    row, col = divmod(square, 8)
+    files = 0
+    for file in range(max(0, col - 1), min(8, col + 2)):
+        files |= FILE_A << file
+    rows = 0
+    for ahead in range(row + step, 8 if step > 0 else -1, step):
+        rows |= 0xFF << 8 * ahead
+    return files & rows
+
+
+# Per square tables: forward spans (a pawn with no enemy pawn in its span can not be stopped) and distances
+# in rows to the goal row.
+WHITE_SPAN = [_forward_span(square, -1) for square in range(64)]
+BLACK_SPAN = [_forward_span(square, 1) for square in range(64)]
+WHITE_DISTANCE = [square >> 3 for square in range(64)]
+BLACK_DISTANCE = [7 - (square >> 3) for square in range(64)]
+
+# Mirror image of a move code, from_square * 64 + to_square: the rules are symmetric under the file mirror
+# (square ^ 7) and, with the colours swapped, under turning the board over (square ^ 56).
+MIRROR_CODE = 7 << 6 | 7
+_REVERSED_BYTES = bytes(int('{:08b}'.format(byte)[::-1], 2) for byte in range(256))
+
+
+def mirror_hash(h):
+    '''
+    Method returns the Zobrist hash of the mirror image (files a <-> h) of a position: the keys of a square and
+    of its mirror square are the two halves of each other, so the halves of the hash swap.
+    '''
+    return h >> 32 | (h & 0xFFFFFFFF) << 32
+
+
+def _zobrist_keys(rng):
+    keys = [0] * 64
+    for square in range(64):
+        if square & 7 < 4:
+            keys[square] = rng.getrandbits(64)
+            keys[square ^ 7] = mirror_hash(keys[square])
+    return keys
+
+
+# Zobrist keys for (square, colour) and for the side to move. The seed is fixed so hashes are stable
+# between processes and runs. The side to move key is its own mirror image, see mirror_hash.
+_zobrist_random = random.Random(2021)
+ZOBRIST_WHITE = _zobrist_keys(_zobrist_random)
+ZOBRIST_BLACK = _zobrist_keys(_zobrist_random)
+ZOBRIST_TURN = _zobrist_random.getrandbits(32) * 0x100000001
+
+
+def to_bits(board):
+    '''
+    Method packs a padded 10x10 bool board into a 64-bit int. Ints (and numpy integer scalars) are returned as is.
+    '''
+    if isinstance(board, int):
+        return board
+    board = np.asarray(board)
+    if board.ndim == 0:
+        return int(board)
+    return int.from_bytes(np.packbits(board[1:9, 1:9], bitorder='little').tobytes(), 'little')
+
+
+def to_array(bits):
+    '''
+    Method unpacks a 64-bit int into a padded 10x10 bool board.
+    '''
+    cells = np.unpackbits(np.frombuffer(int(bits).to_bytes(8, 'little'), dtype=np.uint8), bitorder='little')
+    return np.pad(cells.reshape(8, 8).astype(bool), [(1, 1), (1, 1)], mode='constant')
+
+
+def square_name(bit):
+    sq = bit.bit_length() - 1
+    return chr(ord('a') + sq % 8) + str(8 - sq // 8)
+
+
+def square_bit(name):
+    return 1 << ((8 - int(name[1])) * 8 + ord(name[0]) - ord('a'))
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+def zobrist_squares(bits, table):
+    h = 0
+    while bits:
+        bit = bits & -bits
+        bits ^= bit
+        h ^= table[bit.bit_length() - 1]
+    return h
+
+
+def zobrist(white, black, white_turn):
+    '''
+    Method returns the Zobrist hash of a position from scratch.
+    '''
+    h = zobrist_squares(white, ZOBRIST_WHITE) ^ zobrist_squares(black, ZOBRIST_BLACK)
+    return h ^ ZOBRIST_TURN if white_turn else h
+
+
+def mirror(bits):
+    '''
+    Method returns the mirror image of a packed board, files a <-> h.
+    '''
+    return int.from_bytes(bits.to_bytes(8, 'little').translate(_REVERSED_BYTES), 'little')
+
+
+def flip(bits):
+    '''
+    Method returns a packed board turned over, rows 1 <-> 8.
+    '''
+    return int.from_bytes(bits.to_bytes(8, 'little'), 'big')
+
+
+def canonical(white, black, white_turn):
+    '''
+    Method returns the canonical form of a position under the symmetries of the rules: the file mirror, and the
+    colour flip (colours swapped and the board turned over). The canonical form has white to move.
+    :return: (white, black, mask): square s of the position is square s ^ mask of the canonical form
+    '''
+    mask = 0
+    if not white_turn:
+        white, black, mask = flip(black), flip(white), 56
+    mirrored = mirror(white), mirror(black)
+    if mirrored < (white, black):
+        return mirrored[0], mirrored[1], mask ^ 7
+    return white, black, mask
+
+
+def transform_code(code, mask):
+    '''
+    Method maps a move code between a position and its canonical form, given the mask returned by canonical.
+    '''
+    return code ^ (mask << 6 | mask)
+
+
+def fen2bits(fen):
+    '''
+    Method returns the packed white and black boards of the board part of a FEN string.
+    '''
+    white = 0
+    black = 0
+    rows = re.split('/|\n', fen)
+    if len(rows) != 8:
+        raise Exception("Invalid board")
+    for i, row in enumerate(rows):
+        effective_index = 0
+        for char in row:
+            if char.isdigit():
+                effective_index += ord(char) - ord('0')
+                # digit is a number of cells to skip
+            elif char == 'p' or char == 'q':  # Queen is used at the end of the game to represent winning
+                black |= 1 << (i * 8 + effective_index)
+                effective_index += 1
+            elif char == 'P' or char == 'Q':
+                white |= 1 << (i * 8 + effective_index)
+                effective_index += 1
+            elif char == '.':
+                effective_index += 1
+    return white, black
+
+
+def white_pushes(white, black):
+    '''
+    Method returns the white pushes as (white, black) pairs of packed boards, each followed by its double push.
+    '''
+    moves = []
+    empty = FULL ^ (white | black)
+    singles = (white >> 8) & empty
+    doubles = ((singles & RANK_3) >> 8) & empty
+    while singles:
+        to = singles & -singles
+        singles ^= to
+        moves.append((white ^ (to | to << 8), black))
+        if doubles & (to >> 8):
+            moves.append((white ^ (to << 8 | to >> 8), black))
+    return moves
+
+
+def white_captures(white, black):
+    '''
+    Method returns the white captures, left and then right ones.
+    '''
+    moves = []
+    # killing move is possible iff there is an enemy pawn on the diagonal shifts:
+    targets = ((white & NOT_FILE_A) >> 9) & black
+    while targets:
+        to = targets & -targets
+        targets ^= to
+        moves.append((white ^ (to | to << 9), black ^ to))
+    targets = ((white & NOT_FILE_H) >> 7) & black
+    while targets:
+        to = targets & -targets
+        targets ^= to
+        moves.append((white ^ (to | to << 7), black ^ to))
+    return moves
+
+
+def black_pushes(white, black):
+    '''
+    Method returns the black pushes, mirroring white_pushes.
+    '''
+    moves = []
+    empty = FULL ^ (white | black)
+    singles = (black << 8) & empty
+    doubles = ((singles & RANK_6) << 8) & empty
+    while singles:
+        to = singles & -singles
+        singles ^= to
+        moves.append((white, black ^ (to | to >> 8)))
+        if doubles & (to << 8):
+            moves.append((white, black ^ (to >> 8 | to << 8)))
+    return moves
+
+
+def black_captures(white, black):
+    '''
+    Method returns the black captures, mirroring white_captures.
+    '''
+    moves = []
+    targets = ((black & NOT_FILE_A) << 7) & white
+    while targets:
+        to = targets & -targets
+        targets ^= to
+        moves.append((white ^ to, black ^ (to | to >> 7)))
+    targets = ((black & NOT_FILE_H) << 9) & white
+    while targets:
+        to = targets & -targets
+        targets ^= to
+        moves.append((white ^ to, black ^ (to | to >> 9)))
+    return moves
+
+
+def white_moves(white, black):
+    '''
+    Method returns the list of white moves as (white, black) pairs of packed boards: pushes and then captures.
+    '''
+    return white_pushes(white, black) + white_captures(white, black)
+
+
+def black_moves(white, black):
+    '''
+    Method returns the list of black moves, mirroring white_moves.
+    '''
+    return black_pushes(white, black) + black_captures(white, black)
+
+
+def count_moves(white, black, white_turn):
+    '''
+    Method returns the number of legal moves of a side, without generating them.
+    '''
+    empty = FULL ^ (white | black)
+    if white_turn:
+        singles = (white >> 8) & empty
+        return popcount(singles) + popcount(((singles & RANK_3) >> 8) & empty) + \
+            popcount(((white & NOT_FILE_A) >> 9) & black) + popcount(((white & NOT_FILE_H) >> 7) & black)
+    singles = (black << 8) & empty
+    return popcount(singles) + popcount(((singles & RANK_6) << 8) & empty) + \
+        popcount(((black & NOT_FILE_A) << 7) & white) + popcount(((black & NOT_FILE_H) << 9) & white)
+
+
+def has_moves(white, black, white_turn):
+    empty = FULL ^ (white | black)
+    if white_turn:
+        return bool((white >> 8) & empty or (((white & NOT_FILE_A) >> 9) | ((white & NOT_FILE_H) >> 7)) & black)
+    return bool((black << 8) & empty or (((black & NOT_FILE_A) << 7) | ((black & NOT_FILE_H) << 9)) & white)
+
+
+def has_noisy_moves(white, black, white_turn):
+    '''
+    Method returns True if the side to move has a capture or a push to its last two rows.
+    '''
+    empty = FULL ^ (white | black)
+    if white_turn:
+        return bool((((white & NOT_FILE_A) >> 9) | ((white & NOT_FILE_H) >> 7)) & black or
+                    (white >> 8) & empty & WHITE_PROMOTION)
+    return bool((((black & NOT_FILE_A) << 7) | ((black & NOT_FILE_H) << 9)) & white or
+                (black << 8) & empty & BLACK_PROMOTION)
+
+
+def pack_boards(boards):
+    '''
+    Method packs a stack of (N, 2, 10, 10) padded bool boards into (N, 2) packed uint64 boards.
+    '''
+    cells = np.ascontiguousarray(np.asarray(boards, dtype=bool)[:, :, 1:9, 1:9]).reshape(-1, 2, 64)
+    return np.packbits(cells, axis=2, bitorder='little').view('<u8').reshape(-1, 2).astype(np.uint64)
+
+
+# Move kinds of moves_batch: single push, double push, the captures with a shift by 9 (white) or 7 (black), then by
+# 7 (white) or 9 (black). Distance from the source square to the target one, for white and for black:
+BATCH_STEPS = np.array([[-8, -16, -9, -7], [8, 16, 7, 9]])
+
+
+def moves_batch(boards, white_turn=True):
+    '''
+    Method generates the moves of a stack of positions at once, in whole array operations.
+    :param boards: (N, 2) packed white and black boards, or (N, 2, 10, 10) padded boards
+    :param white_turn: the side to move, of all positions or (N,) of each one
+    :return: (successors, offsets, parents) in CSR layout: successors is (M, 2) packed boards, the moves of
+     position i are successors[offsets[i]:offsets[i + 1]] in the order of FBoard.move_list, and parents (M,)
+     holds the position of every successor
+    '''
+    boards = np.asarray(boards)
+    if boards.ndim == 4:
+        boards = pack_boards(boards)
+    boards = boards.astype(np.uint64).reshape(-1, 2)
+    count = len(boards)
+    turn = np.broadcast_to(np.asarray(white_turn, dtype=bool), (count,))
+    white, black = boards[:, 0], boards[:, 1]
+    mover, other = np.where(turn, white, black), np.where(turn, black, white)
+    empty = ~(white | black)
+    u7, u8, u9 = np.uint64(7), np.uint64(8), np.uint64(9)
+    # targets of every kind of move, white moves with right shifts and black with left ones
+    singles = np.where(turn, white >> u8, black << u8) & empty
+    doubles = np.where(turn, (singles & np.uint64(RANK_3)) >> u8, (singles & np.uint64(RANK_6)) << u8) & empty
+    first = np.where(turn, (white & np.uint64(NOT_FILE_A)) >> u9, (black & np.uint64(NOT_FILE_A)) << u7) & other
+    second = np.where(turn, (white & np.uint64(NOT_FILE_H)) >> u7, (black & np.uint64(NOT_FILE_H)) << u9) & other
+    # a double push is set on the square of its single push, so with 128 bits of [single, double] pairs per square
+    # and then 64 bits per kind of capture, the set bits of a position come in the order of its move list
+    doubles = np.where(turn, doubles << u8, doubles >> u8)
+    masks = np.stack([singles, doubles, first, second], axis=1).astype('<u8')
+    bits = np.unpackbits(masks.view(np.uint8).reshape(count, 4, 8), axis=2, bitorder='little').view(bool)
+    layout = np.concatenate([bits[:, :2].transpose(0, 2, 1).reshape(count, 128), bits[:, 2:].reshape(count, 128)],
+                            axis=1)
+    parents, slots = np.divmod(np.flatnonzero(layout), 256)
+    pushes = slots < 128
+    kinds = np.where(pushes, slots & 1, 2 + ((slots - 128) >> 6))
+    squares = np.where(pushes, slots >> 1, slots & 63)
+    moved = turn[parents]
+    squares += np.where(kinds == 1, np.where(moved, -8, 8), 0)  # the target of a double push
+    sources = squares - BATCH_STEPS[np.where(moved, 0, 1), kinds]
+    target_bits = np.uint64(1) << squares.astype(np.uint64)
+    source_bits = np.uint64(1) << sources.astype(np.uint64)
+    movers = mover[parents] ^ target_bits ^ source_bits
+    others = other[parents] & ~target_bits
+    successors = np.stack([np.where(moved, movers, others), np.where(moved, others, movers)], axis=1)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(parents, minlength=count), out=offsets[1:])
+    return successors, offsets, parents
+
 
 class FBoard:
+    '''
+    Board core on packed 64-bit bitboards. Move lists are generated lazily, on first use, and the staged
+    generator (captures first, then pushes) only generates the stages that are reached.
+    The padded numpy views of the boards (white, black), and of the move lists (moves, opp_moves),
+    are built on demand for code that still works on arrays.
+    '''
+
+    def __init__(self, white_turn=True, white=0, black=0):
+        self.white_bits = to_bits(white)
+        self.black_bits = to_bits(black)
+        self.white_turn = white_turn
+        self.hash = zobrist(self.white_bits, self.black_bits, white_turn)
+        self._moves = None
+        self._opp_moves = None
+
+    @property
+    def white(self):
+        return to_array(self.white_bits)
+
+    @property
+    def black(self):
+        return to_array(self.black_bits)
+
+    @property
+    def move_list(self):
+        if self._moves is None:
+            self._moves = white_moves(self.white_bits, self.black_bits) if self.white_turn else \
+                black_moves(self.white_bits, self.black_bits)
+        return self._moves
+
+    @property
+    def opp_move_list(self):
+        if self._opp_moves is None:
+            self._opp_moves = black_moves(self.white_bits, self.black_bits) if self.white_turn else \
+                white_moves(self.white_bits, self.black_bits)
+        return self._opp_moves
+
+    @property
+    def moves(self):
+        return np.array(self.move_list, dtype=np.uint64).reshape(-1, 2)
+
+    @property
+    def opp_moves(self):
+        return np.array(self.opp_move_list, dtype=np.uint64).reshape(-1, 2)
+
+    def legal_moves_boards(self):
+        '''
+        Method computes the legal moves of both sides, as lists of (white, black) pairs of packed boards,
+        and returns the moves of the side to move.
+        '''
+        self.opp_move_list
+        return self.move_list
+
+    def captures(self):
+        if self.white_turn:
+            return white_captures(self.white_bits, self.black_bits)
+        return black_captures(self.white_bits, self.black_bits)
+
+    def pushes(self):
+        if self.white_turn:
+            return white_pushes(self.white_bits, self.black_bits)
+        return black_pushes(self.white_bits, self.black_bits)
+
+    def noisy_moves(self):
+        '''
+        Method returns the captures and the pushes to the last two rows of the side to move,
+        the moves that quiescence search follows.
+        '''
+        if self.white_turn:
+            return self.captures() + [move for move in self.pushes() if move[0] & ~self.white_bits & WHITE_PROMOTION]
+        return self.captures() + [move for move in self.pushes() if move[1] & ~self.black_bits & BLACK_PROMOTION]
+
+    def is_quiet(self, move):
+        '''
+        Method returns True for a move of the moves list that quiescence search does not follow: a push that
+        does not reach the last two rows.
+        '''
+        if self.white_turn:
+            return move[1] == self.black_bits and not move[0] & ~self.white_bits & WHITE_PROMOTION
+        return move[0] == self.white_bits and not move[1] & ~self.black_bits & BLACK_PROMOTION
+
+    def staged_moves(self):
+        '''
+        Method generates the moves of the side to move stage by stage: captures first, then pushes.
+        '''
+        yield from self.captures()
+        yield from self.pushes()
+
+    def count_moves(self):
+        if self._moves is not None:
+            return len(self._moves)
+        return count_moves(self.white_bits, self.black_bits, self.white_turn)
+
+    def is_checkmate(self):
+        '''
+        Method returns tuple of two booleans.
+         If current board state is checkmate, first boolean is true.
+         If white won, second boolean is True.
+        '''
+        if not has_moves(self.white_bits, self.black_bits, self.white_turn):
+            return True, not self.white_turn
+        if self.white_bits & RANK_8:
+            return True, True
+        if self.black_bits & RANK_1:
+            return True, False
+        return False, False
+
+    def make_move(self, new_board, check=True):
+        '''
+        Method updates boards according to a move from the legal moves list.
+        :param new_board: a (white, black) pair, as packed ints or padded arrays. given by legal_moves_board
+        :param check: set False to skip the legality check, for moves taken from the board's own generators
+        '''
+        new_board = (to_bits(new_board[0]), to_bits(new_board[1]))
+        if check and new_board not in self.move_list:
+            raise Exception("Move is illegal")
+        self.push(new_board)
+
+    def push(self, move):
+        '''
+        Method makes a move in place, without a legality check.
+        :param move: a (white, black) pair of packed boards from the moves of this board
+        :return: an undo record for pop
+        '''
+        undo = (self.white_bits, self.black_bits, self.hash, self._moves, self._opp_moves)
+        # update our data structure, the hash only changes on the squares the move touched:
+        self.hash ^= zobrist_squares(self.white_bits ^ move[0], ZOBRIST_WHITE) ^ \
+            zobrist_squares(self.black_bits ^ move[1], ZOBRIST_BLACK) ^ ZOBRIST_TURN
+        self.white_bits, self.black_bits = move
+        self.white_turn = not self.white_turn
+        self._moves = None
+        self._opp_moves = None
+        return undo
+
+    def push_null(self):
+        '''
+        Method passes the turn to the opponent in place, the null move of null move pruning. Passing is not
+        a legal move in the game.
+        :return: an undo record for pop
+        '''
+        undo = (self.white_bits, self.black_bits, self.hash, self._moves, self._opp_moves)
+        self.hash ^= ZOBRIST_TURN
+        self.white_turn = not self.white_turn
+        self._moves, self._opp_moves = self._opp_moves, self._moves
+        return undo
+
+    def pop(self, undo):
+        '''
+        Method takes back the move of an undo record returned by push.
+        '''
+        self.white_bits, self.black_bits, self.hash, self._moves, self._opp_moves = undo
+        self.white_turn = not self.white_turn
+
+    def key(self):
+        return self.white_bits, self.black_bits, self.white_turn
+
+    def canonical_hash(self):
+        '''
+        Method returns the hash of the position up to the file mirror, the lower of its hash and of its mirror
+        image's, and True if it is the mirror image's.
+        '''
+        mirrored = mirror_hash(self.hash)
+        return (mirrored, True) if mirrored < self.hash else (self.hash, False)
+
+    def move_code(self, move):
+        '''
+        Method returns a compact code, from_square * 64 + to_square, of a (white, black) pair from the moves list.
+        '''
+        if self.white_turn:
+            moved = self.white_bits ^ move[0]
+            source, target = moved & self.white_bits, moved & move[0]
+        else:
+            moved = self.black_bits ^ move[1]
+            source, target = moved & self.black_bits, moved & move[1]
+        return (source.bit_length() - 1) << 6 | (target.bit_length() - 1)
+
+    def decode_move(self, code):
+        '''
+        Method returns the (white, black) pair of a move code, or None if it is not a legal move here.
+        '''
+        source, target = 1 << (code >> 6), 1 << (code & 63)
+        step = (code & 63) - (code >> 6)
+        empty = FULL ^ (self.white_bits | self.black_bits)
+        if self.white_turn:
+            own, enemy, step, home = self.white_bits, self.black_bits, -step, RANK_3 << 8
+        else:
+            own, enemy, home = self.black_bits, self.white_bits, RANK_6 >> 8
+        if not own & source:
+            return None
+        if step == 8:
+            legal = target & empty
+        elif step == 16:
+            legal = source & home and target & empty and (1 << ((code >> 6) + (code & 63)) // 2) & empty
+        elif step == 9:
+            legal = target & enemy and source & (NOT_FILE_A if self.white_turn else NOT_FILE_H)
+        elif step == 7:
+            legal = target & enemy and source & (NOT_FILE_H if self.white_turn else NOT_FILE_A)
+        else:
+            legal = False
+        if not legal:
+            return None
+        if self.white_turn:
+            return self.white_bits ^ source ^ target, self.black_bits & ~target
+        return self.white_bits & ~target, self.black_bits ^ source ^ target
+
+    def move_uci(self, move):
+        '''
+        Method returns a (white, black) pair of the moves list as the source and target squares, e.g. "e2e4".
+        '''
+        code = self.move_code(move)
+        return square_name(1 << (code >> 6)) + square_name(1 << (code & 63))
+
+    def parse_uci(self, move):
+        '''
+        Method returns the (white, black) pair of a move such as "e2e4" (or "e7e8q", only queens promote),
+        or None if it is malformed or not a legal move here.
+        '''
+        if len(move) not in (4, 5) or move[4:] not in ("", "q"):
+            return None
+        if move[0] not in FILES or move[2] not in FILES or move[1] not in RANKS or move[3] not in RANKS:
+            return None
+        source, target = square_bit(move[0:2]), square_bit(move[2:4])
+        return self.decode_move((source.bit_length() - 1) << 6 | (target.bit_length() - 1))
+
+    def copy(self):
+        # packed boards are immutable and the move lists are rebuilt (never mutated) on every move
+        return copy.copy(self)
+
+
+class NumpyBoard:
+    '''
+    The original board core on padded 10x10 bool arrays. FBoard replaced it in the search,
+    it is kept as a reference implementation for benchmarks and cross-checks.
+    '''
+
     def __init__(self, white_turn=True, white=np.zeros((10, 10), dtype=bool), black=np.zeros((10, 10), dtype=bool)):
         self.white = white
         self.black = black
@@ -72,6 +669,8 @@ class FBoard:
                 if idxs[0] == 2 and not constrained[idxs[0] + 2, idxs[1]]:
                     move = self.black.copy()
                     move[idxs[0], idxs[1]] = False
+                    # clearing the origin square on the white board is a no-op (the black pawn stands there),
+                    # Bench.py perft checks this generator against python-chess
                     white_cpy = self.white.copy()
                     white_cpy[idxs[0], idxs[1]] = False
                     move[idxs[0] + 2, idxs[1]] = True
@@ -146,51 +745,56 @@ class FBoard:
 
 
 class GameBoard(FBoard):
+    '''
+    The board of a game: moves are applied on the packed boards and recorded as UCI strings. The python-chess
+    board (PGN export, GUI) and its SVG rendering are only built when asked for.
+    '''
+
     def __init__(self, fen='8/pppppppp/8/8/8/8/PPPPPPPP/8', white_turn=True):
         boards = self.fen2bit(fen)
         super().__init__(white_turn=white_turn, white=boards[0], black=boards[1])
-        self.gameBoard = chess.Board(fen)
-        self.fboardSvg = chess.svg.board(self.gameBoard).encode("UTF-8")
+        self.start = fen, white_turn
+        self.history = []  # moves played, in UCI
+        self._chess = None
+
+    @property
+    def gameBoard(self):
+        '''
+        Method returns the game as a python-chess board, replaying the moves played since it was last asked for.
+        '''
+        import chess
+
+        if self._chess is None:
+            self._chess = chess.Board(self.start[0])
+            self._chess.turn = self.start[1]
+        for move in self.history[len(self._chess.move_stack):]:
+            self._chess.push_uci(move)
+        return self._chess
+
+    @property
+    def fboardSvg(self):
+        import chess.svg
+
+        return chess.svg.board(self.gameBoard).encode("UTF-8")
 
     def fen2bit(self, fen):
-        white = np.zeros((8, 8), dtype=bool)
-        black = np.zeros((8, 8), dtype=bool)
-        rows = re.split('/|\n', fen)
-        if len(rows) != 8:
-            raise Exception("Invalid board")
-        for i, row in enumerate(rows):
-            effective_index = 0
-            for j, char in enumerate(row):
-                if char.isdigit():
-                    effective_index += ord(char) - ord('0')
-                    # digit is a number of cells to skip
-                elif char == 'p' or char == 'q':  # Queen is used at the end of the game to represent winning
-                    black[i][effective_index] = True
-                    effective_index += 1
-                elif char == 'P' or char == 'Q':
-                    white[i][effective_index] = True
-                    effective_index += 1
-                elif char == '.':
-                    effective_index += 1
-        # Our convention is padded boards for shifting
-        black = np.pad(black, [(1, 1), (1, 1)], mode='constant')
-        white = np.pad(white, [(1, 1), (1, 1)], mode='constant')
-        return white, black
+        return fen2bits(fen)
 
     def bit2fen(self, white=None, black=None) -> str:
-        white = self.white if white is None else white
-        black = self.black if black is None else black
+        white = self.white_bits if white is None else to_bits(white)
+        black = self.black_bits if black is None else to_bits(black)
         fen = ""
         for row_i in range(8):
             counter_col = 0
             for col_i in range(8):
-                if white[row_i + 1][col_i + 1]:
+                bit = 1 << (row_i * 8 + col_i)
+                if white & bit:
                     if counter_col > 0:
                         fen = fen + str(counter_col) + 'P'
                         counter_col = 0
                     else:
                         fen = fen + 'P'
-                elif black[row_i + 1][col_i + 1]:
+                elif black & bit:
                     if counter_col > 0:
                         fen = fen + str(counter_col) + 'p'
                         counter_col = 0
@@ -204,44 +808,42 @@ class GameBoard(FBoard):
                 fen = fen + '/'
         return fen
 
-    def move2san(self, white=None, black=None) -> str:
-        move = np.logical_xor(self.white, white)
-        if np.sum(move) == 2:
-            idx = np.transpose(np.nonzero(move))
-            if chr(9 - idx[0, 0] + ord('0')) == '8':
-                return "{0}{1}{2}{3}q".format(chr(idx[1, 1] + ord('a') - 1), chr(9 - idx[1, 0] + ord('0')),
-                                              chr(idx[0, 1] + ord('a') - 1), chr(9 - idx[0, 0] + ord('0')))
-            return "{0}{1}{2}{3}".format(chr(idx[1, 1] + ord('a') - 1), chr(9 - idx[1, 0] + ord('0')),
-                                         chr(idx[0, 1] + ord('a') - 1), chr(9 - idx[0, 0] + ord('0')))
-        move = np.logical_xor(self.black, black)
-        if np.sum(move) == 2:
-            idx = np.transpose(np.nonzero(move))
-            if chr(9 - idx[1, 0] + ord('0')) == '1':
-                return "{0}{1}{2}{3}q".format(chr(idx[0, 1] + ord('a') - 1), chr(9 - idx[0, 0] + ord('0')),
-                                              chr(idx[1, 1] + ord('a') - 1), chr(9 - idx[1, 0] + ord('0')))
-            return "{0}{1}{2}{3}".format(chr(idx[0, 1] + ord('a') - 1), chr(9 - idx[0, 0] + ord('0')),
-                                         chr(idx[1, 1] + ord('a') - 1), chr(9 - idx[1, 0] + ord('0')))
-
     def make_move(self, move):
-        # case of agent move
-        if isinstance(move, np.ndarray):
-            move = self.move2san(white=move[0], black=move[1])
-        self.gameBoard.push_san(move)
-        self.fboardSvg = chess.svg.board(self.gameBoard).encode("UTF-8")
-        new_board = self.fen2bit(str(self.gameBoard))
-        super().make_move(new_board)
-        return move
+        '''
+        Method plays a move, a (white, black) pair of the moves list or a UCI string, and returns it in UCI
+        (with a queen promotion on the last rows).
+        '''
+        if isinstance(move, str):
+            parsed = self.parse_uci(move)
+            if parsed is None:
+                raise ValueError("Move is illegal: {}".format(move))
+            move = parsed
+        else:
+            move = to_bits(move[0]), to_bits(move[1])
+            if move not in self.move_list:
+                raise Exception("Move is illegal")
+        uci = self.move_uci(move)
+        if (move[0] & RANK_8) | (move[1] & RANK_1):
+            uci += 'q'
+        super().make_move(move, check=False)
+        self.history.append(uci)
+        return uci
+
+    def copy(self):
+        board = copy.copy(self)
+        board.history = list(self.history)
+        board._chess = None
+        return board
 
     def player_move(self):
         legal = False
-        # moves = [self.move2san(white=move[0], black=move[1]) for move in self.legal_moves_boards()]
-        moves = list(self.gameBoard.legal_moves)
-        move = moves[0]  # avoiding conflicts
-        print(moves)
+        moves = {self.move_uci(move) for move in self.move_list}
+        move = None
+        print(sorted(moves))
         while not legal:
             print("Enter move:")
-            move = str(input())
-            legal = True if chess.Move.from_uci(move) in moves else False
+            move = str(input()).rstrip('q')
+            legal = move in moves
             if not legal:
                 print("Move is illegal!")
         self.make_move(move)
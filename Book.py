@@ -0,0 +1,155 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+
+import Board
+
+MAGIC = b'TFB2'  # the first book format (TFBK) had the positions as they are, not in their canonical form
+HEADER = struct.Struct('<4sI')  # magic, number of entries
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening.book')
+START_FEN = '8/pppppppp/8/8/8/8/PPPPPPPP/8'
+
+
+def search_position(task):
+    """
+    Pool worker of build: iterative deepening on one position.
+    :return: the move code of the best move
+    """
+    import Agents
+
+    white, black, white_turn, depth = task
+    board = Board.FBoard(white=white, black=black, white_turn=white_turn)
+    agent = Agents.AlphaBetaAgent(board, "W" if white_turn else "B", 0)
+    agent.new_search()
+    move = None
+    for d in range(depth):
+        value, move = agent.search_root(d, first=move)
+        if value >= Agents.WIN:
+            break
+    return board.move_code(move)
+
+
+def book_key(board):
+    """
+    A position and its mirror images and colour flips (see Board.canonical) share one book entry: the hash
+    of their canonical form, which holds the move code of the canonical form.
+    :return: (hash of the canonical form, mask mapping the move codes of the board to the canonical ones)
+    """
+    white, black, mask = Board.canonical(board.white_bits, board.black_bits, board.white_turn)
+    return Board.zobrist(white, black, True), mask
+
+
+def build(fens, plys=6, depth=5, path=DEFAULT_PATH, processes=None):
+    """
+    Builds the book of the given start positions, for both colors. In the positions of the book side
+    the best move found by a depth plys search is stored and followed, in the positions of the opponent
+    every reply is followed, up to plys plys from the start. The symmetric positions of a level are searched
+    and followed once.
+    :return: number of book entries
+    """
+    entries = {}
+    with multiprocessing.Pool(processes) as pool:
+        for book_white in (True, False):
+            frontier = {}
+            for fen in fens:
+                white, black = Board.fen2bits(fen)
+                board = Board.FBoard(white=white, black=black)
+                frontier[book_key(board)[0]] = board
+            for _ in range(plys):
+                boards = [board for board in frontier.values() if not board.is_checkmate()[0]]
+                # every position of the level is searched at once over the pool
+                missing = [board for board in boards if board.white_turn == book_white and
+                           book_key(board)[0] not in entries]
+                codes = pool.map(search_position,
+                                 [(board.white_bits, board.black_bits, board.white_turn, depth) for board in missing])
+                for board, code in zip(missing, codes):
+                    key, mask = book_key(board)
+                    entries[key] = Board.transform_code(code, mask)
+                frontier = {}
+                for board in boards:
+                    if board.white_turn == book_white:
+                        key, mask = book_key(board)
+                        moves = [board.decode_move(Board.transform_code(entries[key], mask))]
+                    else:
+                        moves = board.move_list
+                    for move in moves:
+                        child = board.copy()
+                        child.push(move)
+                        frontier[book_key(child)[0]] = child
+    hashes = sorted(entries)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(hashes)))
+        f.write(array('Q', hashes).tobytes())
+        f.write(array('H', [entries[h] for h in hashes]).tobytes())
+    return len(hashes)
+
+
+class Book:
+    """
+    Read-only opening book mapped with mmap: sorted hashes of canonical positions (see book_key) followed by
+    the move code of each, looked up by binary search.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise Exception("Invalid book file {}, build it again with python Book.py".format(path))
+        view = memoryview(self.data)
+        end = HEADER.size + 8 * self.count
+        self.hashes = view[HEADER.size:end].cast('Q')
+        self.moves = view[end:end + 2 * self.count].cast('H')
+
+    def lookup(self, board):
+        """
+        :return: the book move of the board, or None if the position is not in the book
+        """
+        key, mask = book_key(board)
+        i = bisect_left(self.hashes, key)
+        if i == self.count or self.hashes[i] != key:
+            return None
+        # None on a hash collision with an illegal move
+        return board.decode_move(Board.transform_code(self.moves[i], mask))
+
+
+_opened = {}
+
+
+def load(path=DEFAULT_PATH):
+    """
+    :return: the book of a file, opened once per process, or None if there is no such file
+    """
+    if path not in _opened:
+        _opened[path] = Book(path) if os.path.exists(path) else None
+    return _opened[path]
+
+
+def disable(path=DEFAULT_PATH):
+    """
+    Makes load return None for a file, e.g. to get varied openings from the random warmup in self-play.
+    """
+    _opened[path] = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fen", type=str, nargs="+", default=[START_FEN],
+                        help="start positions of the book, e.g. the Setup positions of the server")
+    parser.add_argument("--plys", type=int, default=6,
+                        help="number of plys from the start positions covered by the book")
+    parser.add_argument("--depth", type=int, default=5,
+                        help="search depth of every book move")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="number of search processes, all cores by default")
+    parser.add_argument("--out", type=str, default=DEFAULT_PATH,
+                        help="book file")
+    args = parser.parse_args()
+    start = time.time()
+    count = build(args.fen, args.plys, args.depth, args.out, args.processes)
+    print("{} positions searched in {:.1f}s, written to {}".format(count, time.time() - start, args.out))
@@ -1,15 +1,12 @@
-from PyQt5.QtSvg import QSvgWidget
-from PyQt5.QtWidgets import (
-    QMainWindow, QApplication,
-    QLabel, QToolBar, QAction, QStatusBar
-)
-import chess.svg
-from Board import GameBoard, FBoard
+from Board import GameBoard
 
-import random
+import asyncio
+import contextlib
+import sys
 import argparse
 import Agents
-import Socket
+import Protocol
+import Telemetry
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--server", type=int, default=1,
@@ -30,134 +27,38 @@ parser.add_argument("--pt", type=int, default=0,
                     help="Print times for each ply if True.")
 parser.add_argument("--fen", type=str, default='8/pppppppp/8/8/8/8/PPPPPPPP/8',
                     help="Initialize board")
+parser.add_argument("--workers", type=int, default=1,
+                    help="Number of search processes of the alpha/best agents")
+parser.add_argument("--telemetry", type=str, default=None,
+                    help="File to write the search statistics of every ply to, as JSON lines. - for stdout")
+parser.add_argument("--timings", type=int, default=0,
+                    help="Add the time split between move generation, hashing and evaluation to the telemetry")
 
 
 args = parser.parse_args()
+telemetry = None  # Telemetry.JsonLines sink shared by the agents of the game, set in main
 
 
-class Game(QMainWindow):
-    def __init__(self, board, socket, game_time=15):
-        super().__init__()
+def telemetry_stream():
+    """
+    :return: a context manager of the --telemetry stream, None if not set. The console is not closed.
+    """
+    if not args.telemetry:
+        return contextlib.nullcontext()
+    if args.telemetry == "-":
+        return contextlib.nullcontext(sys.stdout)
+    return open(args.telemetry, "a")
 
-        self.socket = socket
-        self.setGeometry(100, 100, 900, 915)
 
-        self.widgetSvg = QSvgWidget(parent=self)
-        self.widgetSvg.setGeometry(10, 25, 880, 880)
-
-        if args.color == "R":
-            # Choose random color
-            args.color = "B" if bool(random.getrandbits(1)) else "W"
-
-        self.board = board
-        self.game_time = game_time
-        # Initialize agents
-        self.agent = Agents.agentsDict[args.agent](self.board, args.color, self.game_time)
-        self.agent2 = None
-
-        if not args.human and not args.server:
-            # 2 agents case
-            color2 = "W" if args.color == "B" else "B"
-            self.agent2 = Agents.agentsDict[args.agent2](self.board, color2, self.game_time)
-        # Board visualization:
-        self.widgetSvg.load(self.board.fboardSvg)
-        self.toolbar = QToolBar("My main toolbar")
-        self.addToolBar(self.toolbar)
-        self.button_action = QAction("Make Move", self)
-        self.button_action.triggered.connect(self.play)
-        self.toolbar.addAction(self.button_action)
-
-        self.agent2_move = True
-
-        if args.color == "W" or (args.color == "B" and not self.board.white_turn):
-            time_msg = self.agent.ply()  # If agent is first
-            if args.pt:
-                print(time_msg)
-        self.update_board()
-
-        # print(self.agent.calcBranchingFactor(depth=15))
-
-    def play(self):
-        # self.agent2.heuristic(self.agent2.graph.get_node(self.agent.board.key()))
-        self.toolbar.removeAction(self.button_action)
-        if args.human:
-            self.board.player_move()
-            if self.check_winner():
-                return
-            time_msg = self.agent.ply()  # If agent is first
-            if args.pt:
-                print(time_msg)
-        elif args.server:
-            move = self.socket.recieve()
-            if move.endswith('1') or move.endswith('8'):
-                # for our visualizing protocol for end of game
-                move = move + 'q'
-            self.board.make_move(move)
-            self.update_board()
-            if self.check_winner():
-                return
-            agent_msg = self.agent.ply()  # If agent is first
-            if args.pt:
-                print(agent_msg[0])
-            if args.server:
-                socket.send(agent_msg[1].rstrip("q"))
-        else:  # If two agents- Make move is only on ply
-            if self.agent2_move:
-                time_msg = self.agent2.ply()  # If agent is first
-                if args.pt:
-                    print(time_msg)
-                if self.check_winner():
-                    return
-            else:
-                time_msg = self.agent.ply()  # If agent is first
-                if args.pt:
-                    print(time_msg)
-                if self.check_winner():
-                    return
-            self.agent2_move = not self.agent2_move
-        self.check_winner()
-        self.toolbar.addAction(self.button_action)
-
-    def update_board(self):
-        self.widgetSvg.load(self.board.fboardSvg)
-
-    def check_winner(self):
-        self.update_board()
-        result = self.board.is_checkmate()
-        if result[0]:
-            if (result[1] and args.color == "W") or (not result[1] and args.color == "B"):
-                print("Player1 Won!")
-            else:
-                print("Player2 Won!")
-        return result[0]
-
-
-def handle_setup(setup):
-    pawns = setup.split(' ')
-    bitboard = GameBoard(fen='8/8/8/8/8/8/8/8')
-    for pawn in pawns:
-        if pawn.startswith('W'):
-            bitboard.white[9 - int(pawn[2]), ord(pawn[1]) - ord('a') + 1] = True
-        else:
-            bitboard.black[9 - int(pawn[2]), ord(pawn[1]) - ord('a') + 1] = True
-    return bitboard.bit2fen()
-
-
-def server_game(board, game_time, socket):
-    agent = Agents.agentsDict[args.agent](board, args.color, game_time)
-    while not board.is_checkmate()[0]:  # make move
-        agent_msg = agent.ply()  # agent ply
-        if args.pt:
-            print(agent_msg[0])
-        if args.server:
-            socket.send(agent_msg[1].rstrip("q"))
-
-        move = socket.recieve()  # server ply
-        if move.endswith('1') or move.endswith('8'):
-            # for our protocol for end of game
-            move = move + 'q'
-        board.make_move(move)
-    return
+def create_agent(agent, board, color, game_time):
+    if agent in ("alpha", "best"):
+        agent = Agents.agentsDict[agent](board, color, game_time, workers=args.workers)
+        if telemetry is not None:
+            agent.telemetry = telemetry
+            if args.timings:
+                Telemetry.enable_timings()
+        return agent
+    return Agents.agentsDict[agent](board, color, game_time)
 
 
 if __name__ == "__main__":
@@ -166,31 +67,25 @@ if __name__ == "__main__":
     fen = args.fen
     game_time = 10
     white_turn = True
-    if args.server:
-        socket = Socket.Socket()
-        socket.connect(host=args.ip, port=args.port)
-        # Handle initial messages:
-        msg = socket.recieve()
-        while msg != "Begin" and len(msg) != 4:
-            if msg.startswith("Time"):
-                game_time = int(msg[5:])
-                socket.send("OK")
-            if msg.startswith("Setup"):
-                white_turn = True # Were able to start with black
-                fen = handle_setup(msg[6:])
-                socket.send("OK")
-            msg = socket.recieve()
-        # update color by server:
-        args.color = "W" if msg == "Begin" else "B"
-        board = GameBoard(fen=fen, white_turn=white_turn)
-        if msg != "Begin":
-            board.make_move(msg)
-        server_game(board, game_time, socket)
+    # one telemetry stream for both agents, closed when the game ends
+    with telemetry_stream() as stream:
+        if stream is not None:
+            telemetry = Telemetry.JsonLines(stream)
+        if args.server:
+            # the server sets the color: Begin makes the agent White, a first move from the server makes it Black
+            asyncio.run(Protocol.run_client(
+                lambda board, color, minutes: create_agent(args.agent, board, color, minutes),
+                host=args.ip, port=args.port, fen=fen, game_time=game_time, report=args.pt))
 
-    # visualized game if not against server:
-    else:
-        app = QApplication([])
-        game = Game(board=GameBoard(fen=fen, white_turn=white_turn), game_time=game_time,
-                    socket=socket)  # TODO: add support to predefined fen string
-        game.show()
-        app.exec()  # TODO: visualize moves and move with cursor when offline
+        # visualized game if not against server:
+        else:
+            # Qt and the SVG rendering are only loaded for the GUI
+            from PyQt5.QtWidgets import QApplication
+            from Window import Game
+
+            app = QApplication([])
+            # TODO: add support to predefined fen string
+            game = Game(board=GameBoard(fen=fen, white_turn=white_turn), game_time=game_time,
+                        socket=socket, args=args, create_agent=create_agent)
+            game.show()
+            app.exec()  # TODO: visualize moves and move with cursor when offline
@@ -0,0 +1,99 @@
+from Transposition import NO_MOVE
+
+# Stage scores, a move is ordered by the highest stage it belongs to.
+TT_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 26
+PROMOTION_SCORE = 1 << 24  # promotions and pushes to the last two rows
+KILLER_SCORE = 1 << 22
+HISTORY_CAP = 1 << 20
+
+
+class MoveOrderer:
+    """
+    Orders the moves of a node: transposition table move, captures, promotions and near-promotion pushes,
+    killer moves of the ply and then by history heuristic scores. staged() generates them lazily in that order.
+    Also counts how often the first searched child is the one causing a cutoff.
+    :param killers: number of killer moves kept per ply
+    """
+
+    def __init__(self, killers=2):
+        self.killers_per_ply = killers
+        self.killers = {}
+        self.history = [[0] * 4096, [0] * 4096]  # [white, black][move code]
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.cutoff_histogram = {}  # position of the cutoff move in the ordered moves -> cutoffs
+
+    def new_search(self):
+        """
+        Forgets the killers and ages the history of former plies.
+        """
+        self.killers = {}
+        for table in self.history:
+            for code, score in enumerate(table):
+                table[code] = score >> 1
+
+    def score(self, board, move, code, ply, tt_move):
+        if code == tt_move:
+            return TT_SCORE
+        target = code & 63
+        if board.white_turn:
+            if move[1] != board.black_bits:
+                return CAPTURE_SCORE + 7 - (target >> 3)  # prefer captures closer to the goal
+            if target >> 3 <= 1:
+                return PROMOTION_SCORE + 1 - (target >> 3)
+        else:
+            if move[0] != board.white_bits:
+                return CAPTURE_SCORE + (target >> 3)
+            if target >> 3 >= 6:
+                return PROMOTION_SCORE + (target >> 3) - 6
+        killers = self.killers.get(ply)
+        if killers and code in killers:
+            return KILLER_SCORE - killers.index(code)
+        return self.history[not board.white_turn][code]
+
+    def order(self, board, moves, ply=0, tt_move=NO_MOVE):
+        """
+        :return: the moves, sorted for search
+        """
+        scores = [self.score(board, move, board.move_code(move), ply, tt_move) for move in moves]
+        return [moves[i] for i in sorted(range(len(moves)), key=scores.__getitem__, reverse=True)]
+
+    def staged(self, board, ply=0, tt_move=NO_MOVE):
+        """
+        Generates the moves of a node stage by stage: the transposition table move, the captures and then
+        the pushes, each stage in score order. A stage is generated only if the former ones did not cut off.
+        """
+        first = None if tt_move == NO_MOVE else board.decode_move(tt_move)
+        if first is not None:
+            yield first
+        for stage in (board.captures, board.pushes):
+            yield from self.order(board, [move for move in stage() if move != first], ply)
+
+    def cutoff(self, board, move, ply, depth, index):
+        """
+        Records the move that caused a beta cutoff.
+        :param index: the position of the move in the ordered moves, None if the moves were not ordered
+        (the batched leaves of a depth 1 node), then only the killers and the history learn from the cutoff
+        """
+        if index is not None:
+            self.cutoffs += 1
+            if index == 0:
+                self.first_cutoffs += 1
+            self.cutoff_histogram[index] = self.cutoff_histogram.get(index, 0) + 1
+        captured = move[1] != board.black_bits if board.white_turn else move[0] != board.white_bits
+        if captured:
+            return  # captures are ordered early anyway
+        code = board.move_code(move)
+        killers = self.killers.setdefault(ply, [])
+        if code not in killers:
+            killers.insert(0, code)
+            del killers[self.killers_per_ply:]
+        table = self.history[not board.white_turn]
+        table[code] = min(HISTORY_CAP, table[code] + depth * depth)
+
+    def first_cutoff_rate(self):
+        return self.first_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def report(self):
+        return "cutoffs:{} first move cutoffs:{:.1%}".format(self.cutoffs, self.first_cutoff_rate())
@@ -0,0 +1,97 @@
+import itertools
+import multiprocessing
+
+
+def search_worker(connection, color, tt_size, stop):
+    """
+    Worker process of RootSplitter: searches the root moves it receives with an agent,
+    and a transposition table, of its own, set up with the search settings of each search.
+    """
+    import Agents
+    import Board
+
+    agent = Agents.AlphaBetaAgent(Board.FBoard(), color, 0, tt_size=tt_size)
+    agent.stop = stop
+    search_id = None
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        task_id, settings, board_key, depth, a, b, deadline = task
+        if task_id != search_id:
+            search_id = task_id
+            for key, value in settings.items():
+                setattr(agent, key, value)
+            agent.new_search()
+        agent.deadline = deadline
+        nodes = agent.nodes
+        try:
+            value = agent.alphabeta(Board.FBoard(white=board_key[0], black=board_key[1], white_turn=board_key[2]),
+                                    a=a, b=b, depth=depth)
+        except Agents.SearchTimeout:
+            value = None
+        connection.send((value, agent.nodes - nodes))
+
+
+class RootSplitter:
+    """
+    Splits the root moves of a search over worker processes. The first move is searched alone to get a bound
+    (young brothers wait), then the other moves are searched in rounds of one move per worker, each round with
+    the best value of the former rounds as its alpha. The i-th move of a round always goes to the i-th worker,
+    so the result is deterministic for a fixed number of workers.
+    :param workers: number of worker processes
+    :param stop: event shared with the workers, aborts their searches when set
+    """
+
+    def __init__(self, workers, color, tt_size, stop):
+        self.workers = workers
+        self.connections = []
+        self.search_ids = itertools.count()
+        self.search_id = next(self.search_ids)
+        self.settings = {}  # search settings of the workers' agents
+        for _ in range(workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            multiprocessing.Process(target=search_worker, args=(worker_connection, color, tt_size, stop),
+                                    daemon=True).start()
+            self.connections.append(connection)
+
+    def new_search(self, settings):
+        """
+        :param settings: attributes the workers set on their agents before searching, see Agents.SEARCH_SETTINGS
+        """
+        self.search_id = next(self.search_ids)
+        self.settings = settings
+
+    def search_root(self, board, moves, depth, deadline, a=float('-inf'), b=float('inf')):
+        """
+        :param a: lower bound of the search window
+        :param b: upper bound of the search window, no round is started once a move reached it
+        :return: the best value and move, and the number of nodes the workers searched.
+         Value and move are None if a worker was aborted.
+        """
+        best_value, best_move = float('-inf'), None
+        nodes = 0
+        aborted = False
+        rounds = [moves[:1]] + [moves[i:i + self.workers] for i in range(1, len(moves), self.workers)]
+        for round_moves in rounds:
+            for connection, move in zip(self.connections, round_moves):
+                child_key = (move[0], move[1], not board.white_turn)
+                # negamax window of the child
+                connection.send((self.search_id, self.settings, child_key, depth, -b, -max(a, best_value), deadline))
+            # results are read in move order, so ties go to the earlier move as in the sequential search
+            for connection, move in zip(self.connections, round_moves):
+                value, worker_nodes = connection.recv()
+                nodes += worker_nodes
+                if value is None:
+                    aborted = True
+                elif best_value < -value:
+                    best_value, best_move = -value, move
+            if aborted:
+                return None, None, nodes
+            if best_value >= b:
+                break
+        return best_value, best_move, nodes
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import contextlib
+
+import Board
+
+START_FEN = '8/pppppppp/8/8/8/8/PPPPPPPP/8'
+
+
+class Connection:
+    """
+    One message per line over asyncio streams. TCP delivers a byte stream, so a read may hold several
+    messages or a part of one: the reader buffers the bytes and a message ends at its newline.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host='localhost', port=9999):
+        reader, writer = await asyncio.open_connection(host, int(port))
+        return cls(reader, writer)
+
+    async def receive(self):
+        """
+        :return: the next message, without its newline
+        """
+        line = await self.reader.readline()
+        if not line.endswith(b'\n'):
+            raise ConnectionError("Socket connection broken")
+        return line.decode("utf-8").rstrip("\r\n")
+
+    async def send(self, *messages):
+        """
+        Sends the messages at once, each on its own line.
+        """
+        self.writer.write("".join(message + "\n" for message in messages).encode("utf-8"))
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self.writer.wait_closed()
+
+
+def setup_fen(setup):
+    """
+    :param setup: the pawns of a Setup message, e.g. "WB4 WA3 BG7"
+    :return: the FEN of the position
+    """
+    white, black = 0, 0
+    for pawn in setup.split():
+        if len(pawn) != 3 or pawn[0] not in "WB":
+            continue
+        if pawn[0] == 'W':
+            white |= Board.square_bit(pawn[1:3].lower())
+        else:
+            black |= Board.square_bit(pawn[1:3].lower())
+    return Board.GameBoard(fen='8/8/8/8/8/8/8/8').bit2fen(white, black)
+
+
+def setup_message(fen):
+    """
+    :return: the Setup message of a position
+    """
+    white, black = Board.fen2bits(fen)
+    pawns = []
+    for color, bits in (("W", white), ("B", black)):
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            pawns.append(color + Board.square_name(bit).upper())
+    return "Setup " + " ".join(pawns)
+
+
+def from_protocol(move):
+    """
+    :return: the move of a protocol message, with the queen promotion the boards expect on the last rows
+    """
+    return move + 'q' if move.endswith('1') or move.endswith('8') else move
+
+
+async def handshake(connection, fen=START_FEN, game_time=15):
+    """
+    Client side of the game setup: Welcome, then any Time and Setup messages, each answered by OK,
+    until Begin (the client plays White) or the first move of the server (the client plays Black).
+    :return: (game time in minutes, FEN of the start position, color of the client, first move of the server or None)
+    """
+    if await connection.receive() != "Welcome":
+        raise RuntimeError("Welcome message expected")
+    while True:
+        message = await connection.receive()
+        if message.startswith("Time"):
+            game_time = int(message[5:])
+            await connection.send("OK")
+        elif message.startswith("Setup"):
+            fen = setup_fen(message[6:])  # the Setup position starts with White
+            await connection.send("OK")
+        elif message == "Begin":
+            return game_time, fen, "W", None
+        else:
+            return game_time, fen, "B", message
+
+
+async def greet(connection, game_time=15, fen=START_FEN):
+    """
+    Server side of the game setup: Welcome and Time in one write, as a server may, so a client has to frame
+    its messages, then Setup if the game does not start from the start position. Each one waits for OK.
+    """
+    await connection.send("Welcome", "Time {}".format(game_time))
+    await expect_ok(connection)
+    if fen != START_FEN:
+        await connection.send(setup_message(fen))
+        await expect_ok(connection)
+
+
+async def expect_ok(connection):
+    message = await connection.receive()
+    if message != "OK":
+        raise RuntimeError("OK expected, got {!r}".format(message))
+
+
+async def play(connection, board, agent, executor=None, report=False):
+    """
+    Plays a game over a connection. The searches run in an executor, so the event loop keeps reading
+    the connection while the agent thinks or ponders, and the opponent's move is applied as it arrives.
+    :param report: print the time of every ply
+    :return: the moves of the game, in the protocol's format
+    """
+    loop = asyncio.get_running_loop()
+    moves = []
+    while not board.is_checkmate()[0]:
+        if board.white_turn == agent.is_white:
+            message, move = await loop.run_in_executor(executor, agent.ply)
+            if report:
+                print(message)
+            move = move.rstrip("q")
+            await connection.send(move)
+        else:
+            move = await connection.receive()
+            board.make_move(from_protocol(move))
+        moves.append(move)
+    return moves
+
+
+async def run_client(create_agent, host='localhost', port=9999, fen=START_FEN, game_time=15, report=False):
+    """
+    Connects to a server, sets the game up and plays it.
+    :param create_agent: called with (board, color, game time in minutes), returns the agent
+    :param fen: start position and game_time: minutes, unless the server sends others
+    :return: the moves of the game
+    """
+    connection = await Connection.open(host, port)
+    try:
+        game_time, fen, color, first_move = await handshake(connection, fen, game_time)
+        board = Board.GameBoard(fen=fen, white_turn=True)
+        if first_move is not None:
+            board.make_move(from_protocol(first_move))
+        agent = create_agent(board, color, game_time)
+        moves = await play(connection, board, agent, report=report)
+        return ([first_move] if first_move is not None else []) + moves
+    finally:
+        await connection.close()
+
+
+class StandInServer:
+    """
+    Local stand-in for the game server, to test clients against: every connection gets a game against an agent.
+    :param agent: agent spec of the server side, see Tournament.parse_spec
+    :param client_color: "W" or "B", the color of the connecting client
+    """
+
+    def __init__(self, agent="random", game_time=15, fen=START_FEN, client_color="W"):
+        self.agent = agent
+        self.game_time = game_time
+        self.fen = fen
+        self.client_color = client_color
+        self.games = []  # a dict per finished game
+
+    async def handle(self, reader, writer):
+        import Tournament
+
+        connection = Connection(reader, writer)
+        loop = asyncio.get_running_loop()
+        game = {"client": self.client_color, "moves": [], "result": None}
+        try:
+            await greet(connection, self.game_time, self.fen)
+            board = Board.GameBoard(fen=self.fen, white_turn=True)
+            server_color = "B" if self.client_color == "W" else "W"
+            agent = Tournament.create_agent(self.agent, board, server_color, self.game_time)
+            if self.client_color == "W":
+                await connection.send("Begin")
+            while not board.is_checkmate()[0]:
+                if board.white_turn == agent.is_white:
+                    move = (await loop.run_in_executor(None, agent.ply))[1].rstrip("q")
+                    await connection.send(move)
+                else:
+                    move = await connection.receive()
+                    parsed = board.parse_uci(from_protocol(move))
+                    if parsed is None:
+                        # the client forfeits the game
+                        game["moves"].append(move)
+                        game["result"] = "illegal move"
+                        await connection.send("Error illegal move {}".format(move))
+                        return
+                    board.make_move(parsed)
+                game["moves"].append(move)
+            game["result"] = "1-0" if board.is_checkmate()[1] else "0-1"
+        except ConnectionError:
+            game["result"] = "disconnected"
+        finally:
+            self.games.append(game)
+            await connection.close()
+
+    async def serve(self, host='localhost', port=9999):
+        """
+        :return: the listening asyncio server
+        """
+        return await asyncio.start_server(self.handle, host, int(port))
+
+
+async def main(args):
+    server = await StandInServer(args.agent, args.time, args.fen, args.color).serve(args.ip, args.port)
+    print("Stand-in server on {}:{}".format(args.ip, args.port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the game server, one game per connection. "
+                                                 "Connect with python Game.py --server 1")
+    parser.add_argument("--ip", type=str, default="localhost",
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=9999,
+                        help="port to listen on")
+    parser.add_argument("--agent", type=str, default="random",
+                        help="agent of the server side, e.g. alpha or best:stable_iterations=4")
+    parser.add_argument("--time", type=int, default=15,
+                        help="game time sent in the Time message, in minutes")
+    parser.add_argument("--fen", type=str, default=START_FEN,
+                        help="start position, sent in a Setup message if not the default one")
+    parser.add_argument("--color", type=str, default="W", choices=["W", "B"],
+                        help="color of the connecting client")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+
+import Agents
+import Board
+import Book
+import Protocol
+import Tablebase
+import Tournament
+
+_agents = {}  # (agent spec, color) -> agent of a worker process, shared by the games of that color
+
+
+def init_worker():
+    """
+    Pool initializer: opens the read-only resources once per process. The book and the tablebase are mapped
+    with mmap, so their pages are shared by all the workers, and the mask tables of Board are built at import.
+    """
+    Book.load()
+    Tablebase.load()
+
+
+def search(task):
+    """
+    Pool worker: time-managed search of one move of a game.
+    :param task: (agent spec, color, white, black, white_turn, clock seconds, moves played, share of the budget)
+    :return: (move code, completed depth, nodes)
+    """
+    spec, color, white, black, white_turn, clock, moves, share = task
+    board = Board.FBoard(white=white, black=black, white_turn=white_turn)
+    agent = _agents.get((spec, color))
+    if agent is None:
+        agent = _agents[(spec, color)] = Tournament.create_agent(spec, board, color, clock / 60)
+    agent.board = board
+    move = agent.book_move()
+    if move is not None:
+        return board.move_code(move), 0, 0
+    agent.game_time, agent.move_counter, agent.time_share = clock, moves, share
+    nodes = agent.nodes
+    move = agent.best_move()
+    return board.move_code(move), agent.depth, agent.nodes - nodes
+
+
+class Scheduler:
+    """
+    Runs the searches of all the games on one process pool. A game waits for one search at a time, so serving
+    the searches in the order they were requested is round robin over the games. When more searches are running
+    or waiting than there are processes, each one gets processes / demand of its budget: every game keeps an
+    equal share of the pool and its clock, which keeps running while its search waits, is not drained.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count()
+        # the pool forks all its workers now: workers forked later would inherit the sockets of the open games
+        # and keep them open once the games end
+        self.pool = multiprocessing.Pool(self.processes, initializer=init_worker)
+        self.slots = asyncio.Semaphore(self.processes)  # wakes its waiters in FIFO order
+        self.demand = 0
+
+    async def search(self, spec, color, board, clock, moves):
+        """
+        :param clock: seconds left on the clock of the game, when the search was requested
+        :return: the move code of the best move
+        """
+        requested = time.time()
+        self.demand += 1
+        try:
+            async with self.slots:
+                share = min(1.0, self.processes / self.demand)
+                task = (spec, color, board.white_bits, board.black_bits, board.white_turn,
+                        clock - (time.time() - requested), moves, share)
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self.pool.apply_async(search, (task,),
+                                      callback=lambda result: loop.call_soon_threadsafe(settle, future, result),
+                                      error_callback=lambda error: loop.call_soon_threadsafe(settle, future, error))
+                code, _, _ = await future
+                return code
+        finally:
+            self.demand -= 1
+
+    def shutdown(self):
+        self.pool.terminate()
+
+
+def settle(future, result):
+    """
+    Sets the result (or the exception) of a pool task on its asyncio future, unless the game was cancelled.
+    """
+    if future.done():
+        return
+    if isinstance(result, BaseException):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+class EngineServer:
+    """
+    Serves many games on one port, each with its own board and clock, in one process: the games are asyncio
+    sessions and their searches share the processes of a Scheduler.
+    :param agent: agent spec of the engine, a time-managed agent (best), see Tournament.parse_spec
+    :param client_color: "W" or "B", the color of the connecting clients
+    """
+
+    def __init__(self, agent="best", game_time=15, fen=Protocol.START_FEN, client_color="B", processes=None):
+        name, _ = Tournament.parse_spec(agent)
+        if not issubclass(Agents.agentsDict[name], Agents.BestAgent):
+            raise ValueError("The engine needs a time-managed agent, got {}".format(name))
+        self.agent = agent
+        self.game_time = game_time
+        self.fen = fen
+        self.client_color = client_color
+        self.scheduler = Scheduler(processes)
+        self.games = []  # a dict per finished game
+
+    async def handle(self, reader, writer):
+        connection = Protocol.Connection(reader, writer)
+        engine_color = "B" if self.client_color == "W" else "W"
+        game = {"client": self.client_color, "moves": [], "result": None, "clock": self.game_time * 60}
+        try:
+            await Protocol.greet(connection, self.game_time, self.fen)
+            white, black = Board.fen2bits(self.fen)
+            board = Board.FBoard(white=white, black=black)
+            if self.client_color == "W":
+                await connection.send("Begin")
+            while not board.is_checkmate()[0]:
+                if board.white_turn == (engine_color == "W"):
+                    start = time.time()
+                    code = await self.scheduler.search(self.agent, engine_color, board, game["clock"],
+                                                       len(game["moves"]) // 2)
+                    move = board.decode_move(code)
+                    text = board.move_uci(move)
+                    board.make_move(move)
+                    await connection.send(text)
+                    game["clock"] -= time.time() - start
+                    if game["clock"] < 0:
+                        game["moves"].append(text)
+                        game["result"] = "time"
+                        return
+                else:
+                    text = await connection.receive()
+                    move = board.parse_uci(text)
+                    if move is None:
+                        # the client forfeits the game
+                        game["moves"].append(text)
+                        game["result"] = "illegal move"
+                        await connection.send("Error illegal move {}".format(text))
+                        return
+                    board.make_move(move)
+                game["moves"].append(text)
+            game["result"] = "1-0" if board.is_checkmate()[1] else "0-1"
+        except ConnectionError:
+            game["result"] = "disconnected"
+        finally:
+            self.games.append(game)
+            await connection.close()
+
+    async def serve(self, host='localhost', port=9999):
+        """
+        :return: the listening asyncio server
+        """
+        return await asyncio.start_server(self.handle, host, int(port))
+
+
+async def main(args):
+    engine = EngineServer(args.agent, args.time, args.fen, args.color, args.processes)
+    server = await engine.serve(args.ip, args.port)
+    print("Engine server on {}:{} with {} processes".format(args.ip, args.port, engine.scheduler.processes))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        engine.scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Engine server: plays every connecting client, all the games in one "
+                                                 "process with their searches on a shared process pool")
+    parser.add_argument("--ip", type=str, default="localhost",
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=9999,
+                        help="port to listen on")
+    parser.add_argument("--agent", type=str, default="best",
+                        help="agent of the engine, e.g. best:stable_iterations=4")
+    parser.add_argument("--time", type=int, default=15,
+                        help="minutes on the clock of every game, sent in the Time message")
+    parser.add_argument("--fen", type=str, default=Protocol.START_FEN,
+                        help="start position, sent in a Setup message if not the default one")
+    parser.add_argument("--color", type=str, default="B", choices=["W", "B"],
+                        help="color of the connecting clients")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="number of search processes shared by the games")
+    asyncio.run(main(parser.parse_args()))
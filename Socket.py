@@ -2,11 +2,11 @@ import socket
 import sys
 
 port_ip = 0000  # TODO: get from Shay
-MSGLEN = sys.getsizeof('Setup WB4 WA3 WC2 BG7 WD4 BG6 BE7 WB4 WA3 WC2 BG7 WD4 BG6 BE7 BG6 BE7 BLACK')
+CHUNK = 4096
 
 class Socket:
     """
-    Comunicate with server
+    Comunicate with server, blocking. Game.py uses the asyncio client of Protocol.py.
     """
 
     def __init__(self, sock=None):
@@ -15,6 +15,7 @@ class Socket:
                 socket.AF_INET, socket.SOCK_STREAM)
         else:
             self.sock = sock
+        self.buffer = b''  # received bytes of the messages not returned yet
 
     def connect(self, host='localhost', port=port_ip):
         server_address = (host, int(port))
@@ -26,14 +27,14 @@ class Socket:
             raise RuntimeError("Welcome message expected")
 
     def recieve(self, msg=None):
-        if msg is None:
-            msg_len = MSGLEN
-        else:
-            msg_len = sys.getsizeof(msg)
-        chunk = self.sock.recv(msg_len)
-        if chunk == b'':
-            raise RuntimeError("Socket connection broken")
-        return chunk.decode("utf-8").rstrip("\n")
+        # a message ends at a newline, a chunk may hold a part of a message or several ones
+        while b'\n' not in self.buffer:
+            chunk = self.sock.recv(CHUNK)
+            if chunk == b'':
+                raise RuntimeError("Socket connection broken")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode("utf-8").rstrip("\r")
 
     def send(self, msg):
         msg += '\n'
@@ -0,0 +1,183 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from math import comb
+
+import Board
+
+# Results for the side to move. The positions with black to move are the colour flipped ones with white to move
+# (see Board.canonical), so only white to move is stored. An entry byte holds 2 * distance + 1 for a win in
+# distance plys, 2 * distance + 2 for a loss in distance plys, DRAW_ENTRY for a draw and 0 for an index with no
+# position.
+WIN, LOSS, DRAW = 1, -1, 0
+DRAW_ENTRY = 255
+
+MAGIC = b'TFTB'
+HEADER = struct.Struct('<4sBB2x')
+VERSION = 2  # version 1 files also stored the positions with black to move
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'endgame.tb')
+
+# Pawns that did not win yet stand on rows 1..6 (bits 8..55), so positions are indexed over these 48 squares.
+FIRST_SQUARE = 8
+SQUARES = 48
+PLAYABLE = Board.FULL ^ (Board.RANK_8 | Board.RANK_1)
+
+
+def subset_offsets(pawns):
+    """
+    :return: offsets[k], the index of the first set of k pawns, for k = 0..pawns + 1
+    """
+    offsets = [0]
+    for k in range(pawns + 1):
+        offsets.append(offsets[-1] + comb(SQUARES, k))
+    return offsets
+
+
+def subset_rank(bits, offsets):
+    """
+    Combinatorial number system rank of a set of pawns, among the sets with as many pawns.
+    """
+    rank = 0
+    count = 0
+    while bits:
+        bit = bits & -bits
+        bits ^= bit
+        count += 1
+        rank += comb(bit.bit_length() - 1 - FIRST_SQUARE, count)
+    return offsets[count] + rank
+
+
+def subsets(pawns):
+    """
+    :return: for every set of at most pawns squares: (bits, number of pawns, sum of the row indexes)
+    """
+    result = [(0, 0, 0)]
+    for bits, count, rows in result:
+        if count == pawns:
+            continue
+        low = (bits & -bits).bit_length() - 1 if bits else FIRST_SQUARE + SQUARES
+        for sq in range(FIRST_SQUARE, low):
+            result.append((bits | 1 << sq, count + 1, rows + sq // 8))
+    return result
+
+
+def build(pawns, path=DEFAULT_PATH):
+    """
+    Solves every position with at most pawns pawns per side and white to move by retrograde analysis and writes
+    the tablebase.
+    Pawns only move forward and captures remove pawns, so positions are solved from the end of the game
+    backwards: fewer pawns first and, for as many pawns, the most advanced ones first. Every successor
+    of a position, and its colour flip, is then either terminal or already solved.
+    :return: number of solved positions
+    """
+    offsets = subset_offsets(pawns)
+    size = offsets[-1]
+    table = bytearray(size * size)
+    # group the sets of each side by (pawns, advancement), a move never decreases the advancement of the mover
+    white_groups, black_groups = {}, {}
+    for bits, count, rows in subsets(pawns):
+        rank = subset_rank(bits, offsets)
+        white_groups.setdefault((count, 7 * count - rows), []).append((bits, rank))
+        black_groups.setdefault((count, rows), []).append((bits, rank))
+    order = sorted({(white[0] + black[0], white[1] + black[1]) for white in white_groups for black in black_groups},
+                   key=lambda key: (key[0], -key[1]))
+    solved = 0
+    for total, advancement in order:
+        for (white_count, white_advancement), whites in white_groups.items():
+            blacks = black_groups.get((total - white_count, advancement - white_advancement))
+            if blacks is None:
+                continue
+            for white, white_rank in whites:
+                for black, black_rank in blacks:
+                    if white & black:
+                        continue
+                    table[white_rank * size + black_rank] = solve(table, white, black, offsets)
+                    solved += 1
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, pawns))
+        f.write(table)
+    return solved
+
+
+def solve(table, white, black, offsets):
+    """
+    :return: the entry of a position with white to move whose successors are all solved
+    """
+    size = offsets[-1]
+    win = None
+    loss = 0
+    for child_white, child_black in Board.white_moves(white, black):
+        if child_white & Board.RANK_8 or not Board.has_moves(child_white, child_black, False):
+            return 2 * 1 + 1  # the move wins at once
+        # black to move: the entry of the colour flipped child
+        entry = table[subset_rank(Board.flip(child_black), offsets) * size +
+                      subset_rank(Board.flip(child_white), offsets)]
+        if entry % 2 == 0:  # the opponent loses
+            distance = (entry - 2) // 2 + 1
+            win = distance if win is None else min(win, distance)
+        else:
+            loss = max(loss, (entry - 1) // 2 + 1)
+    if win is not None:
+        return 2 * win + 1
+    return 2 * loss + 2
+
+
+class Tablebase:
+    """
+    Read-only tablebase file mapped with mmap: opening it is instant and its pages are shared
+    by every process probing the same file.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.pawns = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise Exception("Invalid tablebase file")
+        self.offsets = subset_offsets(self.pawns)
+        self.size = self.offsets[-1]
+        self.stride = 2 if version == 1 else 1
+
+    def probe(self, white, black, white_turn):
+        """
+        :return: (result, distance in plys) for the side to move, or None if the position is not in the tablebase
+        """
+        if (white | black) & ~PLAYABLE or Board.popcount(white) > self.pawns or Board.popcount(black) > self.pawns:
+            return None
+        if not white_turn:
+            white, black = Board.flip(black), Board.flip(white)
+        index = (subset_rank(white, self.offsets) * self.size + subset_rank(black, self.offsets)) * self.stride
+        entry = self.data[HEADER.size + index]
+        if entry == 0:
+            return None
+        if entry == DRAW_ENTRY:
+            return DRAW, 0
+        if entry % 2:
+            return WIN, (entry - 1) // 2
+        return LOSS, (entry - 2) // 2
+
+
+_opened = {}
+
+
+def load(path=DEFAULT_PATH):
+    """
+    :return: the tablebase of a file, opened once per process, or None if there is no such file
+    """
+    if path not in _opened:
+        _opened[path] = Tablebase(path) if os.path.exists(path) else None
+    return _opened[path]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pawns", type=int, default=2,
+                        help="maximal number of pawns per side")
+    parser.add_argument("--out", type=str, default=DEFAULT_PATH,
+                        help="tablebase file")
+    args = parser.parse_args()
+    start = time.time()
+    positions = build(args.pawns, args.out)
+    print("{} positions solved in {:.1f}s, written to {}".format(positions, time.time() - start, args.out))
@@ -0,0 +1,101 @@
+import json
+import time
+from time import perf_counter
+
+import Board
+
+# function names timed by enable_timings, per category
+TIMED = {"movegen": (Board, ("white_pushes", "white_captures", "black_pushes", "black_captures", "count_moves",
+                             "has_moves")),
+         "hashing": (Board, ("zobrist_squares", "zobrist"))}
+TIMED_METHODS = ("evaluate_bits",)  # Agent methods, timed as "eval"
+
+times = {"movegen": 0.0, "hashing": 0.0, "eval": 0.0}  # exclusive seconds per category since enable_timings
+_timing = {"enabled": False, "total": 0.0}
+
+
+def _timed(category, function):
+    def timed(*args, **kwargs):
+        outer = _timing["total"]
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            # time of timed calls made inside this one goes to their own category
+            times[category] += elapsed - (_timing["total"] - outer)
+            _timing["total"] = outer + elapsed
+    timed.__wrapped__ = function
+    return timed
+
+
+def enable_timings():
+    """
+    Times move generation, hashing and evaluation by wrapping their functions, process wide.
+    Costs a few microseconds per call, so it is only done on request. Timings include the pondering
+    of agents running in the same process.
+    """
+    import Agents
+
+    if _timing["enabled"]:
+        return
+    _timing["enabled"] = True
+    for category, (module, names) in TIMED.items():
+        for name in names:
+            setattr(module, name, _timed(category, getattr(module, name)))
+    for name in TIMED_METHODS:
+        setattr(Agents.Agent, name, _timed("eval", getattr(Agents.Agent, name)))
+
+
+def snapshot(agent):
+    """
+    :return: the counters of an agent, to diff with record() after a ply
+    """
+    return {"time": time.time(), "nodes": agent.nodes, "leaves": agent.leaves, "tt_probes": agent.table.probes,
+            "tt_hits": agent.table.hits, "tablebase_hits": agent.tablebase_hits, "null_cutoffs": agent.null_cutoffs,
+            "reductions": agent.reductions, "futility_prunes": agent.futility_prunes,
+            "cutoffs": dict(agent.orderer.cutoff_histogram), "times": dict(times)}
+
+
+def record(agent, before, source, move):
+    """
+    :param before: snapshot of the agent when the ply started
+    :param source: where the move came from: "book", "random" or "search"
+    :param move: the move played, in SAN
+    :return: the statistics of the ply, as a json serializable dict
+    """
+    elapsed = time.time() - before["time"]
+    nodes = agent.nodes - before["nodes"]
+    probes = agent.table.probes - before["tt_probes"]
+    hits = agent.table.hits - before["tt_hits"]
+    cutoffs = {index: count - before["cutoffs"].get(index, 0)
+               for index, count in sorted(agent.orderer.cutoff_histogram.items())}
+    depth = agent.depth if source == "search" else 0
+    stats = {"color": "W" if agent.is_white else "B", "move": move, "source": source, "seconds": round(elapsed, 6),
+             "depth": depth, "nodes": nodes, "leaves": agent.leaves - before["leaves"],
+             "nps": round(nodes / elapsed) if elapsed else 0,
+             "ebf": round(nodes ** (1 / depth), 3) if depth and nodes else None,
+             "tt_probes": probes, "tt_hits": hits, "tt_hit_rate": round(hits / probes, 4) if probes else None,
+             "tablebase_hits": agent.tablebase_hits - before["tablebase_hits"],
+             "null_cutoffs": agent.null_cutoffs - before["null_cutoffs"],
+             "reductions": agent.reductions - before["reductions"],
+             "futility_prunes": agent.futility_prunes - before["futility_prunes"],
+             "cutoffs": {str(index): count for index, count in cutoffs.items() if count}}
+    if _timing["enabled"]:
+        stats["times"] = {category: round(seconds - before["times"][category], 6)
+                          for category, seconds in times.items()}
+    return stats
+
+
+class JsonLines:
+    """
+    Telemetry callback writing each record as a JSON line.
+    :param stream: a text file
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self, stats):
+        self.stream.write(json.dumps(stats) + "\n")
+        self.stream.flush()
@@ -0,0 +1,251 @@
+import argparse
+import ast
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import Agents
+import Board
+import Book
+
+START_FEN = '8/pppppppp/8/8/8/8/PPPPPPPP/8'
+
+
+def parse_spec(spec):
+    """
+    Parses an agent spec: a key of Agents.agentsDict, optionally followed by attributes to set on the agent,
+    e.g. "best:batch_leaves=False,stable_iterations=4".
+    :return: (name, {attribute: value})
+    """
+    name, _, options = spec.partition(':')
+    if name not in Agents.agentsDict:
+        raise ValueError("Unknown agent {}, expected one of {}".format(name, sorted(Agents.agentsDict)))
+    attributes = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        try:
+            attributes[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            attributes[key] = value
+    return name, attributes
+
+
+def create_agent(spec, board, color, minutes):
+    name, attributes = parse_spec(spec)
+    if name == "best":
+        # pondering threads would take the interpreter from the opponent playing in the same process
+        agent = Agents.BestAgent(board, color, minutes, ponder=False)
+    else:
+        agent = Agents.agentsDict[name](board, color, minutes)
+    for key, value in attributes.items():
+        if not hasattr(agent, key):
+            raise ValueError("{} has no attribute {}".format(type(agent).__name__, key))
+        setattr(agent, key, value)
+    return agent
+
+
+def play_game(task):
+    """
+    Pool worker: plays one game with a clock per side. A side whose clock runs out loses.
+    :return: the result of the game as a dict
+    """
+    index, fen, white_turn, white_spec, black_spec, minutes, seed, book, pgn = task
+    random.seed(seed)  # random warmup moves
+    if not book:
+        Book.disable()
+    board = Board.GameBoard(fen=fen, white_turn=white_turn)
+    agents = {True: create_agent(white_spec, board, "W", minutes),
+              False: create_agent(black_spec, board, "B", minutes)}
+    clocks = {True: minutes * 60, False: minutes * 60}
+    searches = {True: [0, 0, 0, 0.0], False: [0, 0, 0, 0.0]}  # searched plys, sum of their depths, nodes, seconds
+    moves = []
+    reason = None
+    with contextlib.redirect_stdout(io.StringIO()):  # agents print their search reports
+        while not board.is_checkmate()[0]:
+            side = board.white_turn
+            agent = agents[side]
+            nodes = getattr(agent, "nodes", 0)
+            start = time.time()
+            moves.append(agent.ply()[1])
+            elapsed = time.time() - start
+            clocks[side] -= elapsed
+            if getattr(agent, "nodes", 0) > nodes:  # not a book or random move
+                search = searches[side]
+                search[0] += 1
+                search[1] += agent.depth
+                search[2] += agent.nodes - nodes
+                search[3] += elapsed
+            if clocks[side] < 0:
+                white_won, reason = not side, "time"
+                break
+    if reason is None:
+        white_won = board.is_checkmate()[1]
+        reason = "goal" if board.white_bits & Board.RANK_8 or board.black_bits & Board.RANK_1 else "no moves"
+    result = {"game": index, "white": white_spec, "black": black_spec, "fen": fen,
+              "result": "1-0" if white_won else "0-1", "reason": reason, "plys": len(moves), "moves": moves,
+              "clocks": {"W": round(clocks[True], 3), "B": round(clocks[False], 3)},
+              "searches": {"W": searches[True], "B": searches[False]}}
+    if pgn:
+        import chess.pgn
+
+        game = chess.pgn.Game.from_board(board.gameBoard)
+        game.headers["Event"] = "Tournament"
+        game.headers["Round"] = str(index + 1)
+        game.headers["White"] = white_spec
+        game.headers["Black"] = black_spec
+        game.headers["Result"] = result["result"]
+        game.headers["Termination"] = reason
+        result["pgn"] = str(game)
+    return result
+
+
+def elo(score):
+    return -400 * math.log10(1 / score - 1)
+
+
+class Statistics:
+    """
+    Score of the first agent against the second one, with the Elo difference and a sequential probability
+    ratio test of H0: elo = elo0 against H1: elo = elo1. Games are Bernoulli trials, a draw counts as half
+    a win and half a loss.
+    """
+
+    def __init__(self, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+        self.scores = []
+        self.searches = ([0, 0, 0, 0.0], [0, 0, 0, 0.0])  # of the first and second agent, see play_game
+        self.elo0, self.elo1 = elo0, elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def add(self, score, first=None, second=None):
+        """
+        :param first: searched plys, sum of their depths, nodes and seconds of the first agent in the game
+        """
+        self.scores.append(score)
+        for total, search in zip(self.searches, (first, second)):
+            if search is not None:
+                for i, value in enumerate(search):
+                    total[i] += value
+
+    def search_report(self):
+        """
+        :return: the mean depth and the nodes per second of the searches of the first agent against the second one
+        """
+        depths = [depths / max(1, plys) for plys, depths, _, _ in self.searches]
+        speeds = [nodes / seconds if seconds else 0 for _, _, nodes, seconds in self.searches]
+        return "depth:{:.2f} vs {:.2f} nps:{:.0f} vs {:.0f}".format(depths[0], depths[1], speeds[0], speeds[1])
+
+    def elo(self):
+        """
+        :return: the Elo difference and the half width of its 95% interval
+        """
+        n = len(self.scores)
+        clamp = 1 / (2 * n)  # keeps a 100% or 0% score finite
+        mean = min(1 - clamp, max(clamp, sum(self.scores) / n))
+        deviation = 1.96 * math.sqrt(mean * (1 - mean) / n)
+        low, high = max(clamp, mean - deviation), min(1 - clamp, mean + deviation)
+        return elo(mean), (elo(high) - elo(low)) / 2
+
+    def llr(self):
+        points = sum(self.scores)
+        s0, s1 = 1 / (1 + 10 ** (-self.elo0 / 400)), 1 / (1 + 10 ** (-self.elo1 / 400))
+        return points * math.log(s1 / s0) + (len(self.scores) - points) * math.log((1 - s1) / (1 - s0))
+
+    def sprt(self):
+        """
+        :return: "H1" or "H0" once accepted, else None
+        """
+        llr = self.llr()
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+    def report(self):
+        wins = self.scores.count(1)
+        losses = self.scores.count(0)
+        value, error = self.elo()
+        return "games:{} +{} -{} ={} elo:{:.1f} +/- {:.1f} llr:{:.2f} [{:.2f}, {:.2f}] {}".format(
+            len(self.scores), wins, losses, len(self.scores) - wins - losses, value, error, self.llr(), self.lower,
+            self.upper, self.search_report())
+
+
+def tasks(args):
+    """
+    Games in pairs: every start position is played twice, with the colors swapped.
+    """
+    for index in range(args.games):
+        fen = args.fen[(index // 2) % len(args.fen)]
+        placement, _, turn = fen.partition(' ')
+        first, second = (args.agent, args.agent2) if index % 2 == 0 else (args.agent2, args.agent)
+        yield (index, placement, turn != 'b', first, second, args.time, args.seed + index, args.book,
+               args.format == "pgn")
+
+
+def main(args):
+    parse_spec(args.agent)
+    parse_spec(args.agent2)
+    out = sys.stdout if args.out == "-" else open(args.out, "a")
+    statistics = Statistics(args.elo0, args.elo1, args.alpha, args.beta)
+    with multiprocessing.Pool(args.processes) as pool:
+        for result in pool.imap_unordered(play_game, tasks(args)):
+            out.write(result.pop("pgn") + "\n\n" if args.format == "pgn" else json.dumps(result) + "\n")
+            out.flush()
+            first_white = result["game"] % 2 == 0  # see tasks
+            first, second = ("W", "B") if first_white else ("B", "W")
+            statistics.add(1.0 if (result["result"] == "1-0") == first_white else 0.0,
+                           result["searches"][first], result["searches"][second])
+            print(statistics.report(), file=sys.stderr)
+            decision = statistics.sprt() if args.sprt else None
+            if decision is not None:
+                print("SPRT: {} accepted".format(decision), file=sys.stderr)
+                pool.terminate()
+                break
+    if out is not sys.stdout:
+        out.close()
+    return statistics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Headless match between two agents. An agent is a key of Agents.agentsDict, optionally with "
+                    "attributes to set, e.g. best:stable_iterations=4,batch_leaves=False")
+    parser.add_argument("--agent", type=str, default="best",
+                        help="first agent, the Elo difference is its own")
+    parser.add_argument("--agent2", type=str, default="alpha",
+                        help="second agent")
+    parser.add_argument("--games", type=int, default=1000,
+                        help="maximal number of games")
+    parser.add_argument("--fen", type=str, nargs="+", default=[START_FEN],
+                        help="start positions, played in turn. A FEN may end with the side to move (w or b)")
+    parser.add_argument("--time", type=float, default=1.0,
+                        help="minutes on the clock of each side")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="number of games played at once")
+    parser.add_argument("--book", type=int, default=0,
+                        help="let the agents use the opening book. Off by default, the random warmup moves "
+                             "vary the games")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the random warmup moves of the first game")
+    parser.add_argument("--format", type=str, default="jsonl", choices=["jsonl", "pgn"],
+                        help="format of the game records")
+    parser.add_argument("--out", type=str, default="-",
+                        help="file to append the game records to, - for stdout")
+    parser.add_argument("--sprt", type=int, default=1,
+                        help="stop as soon as the SPRT accepts a hypothesis")
+    parser.add_argument("--elo0", type=float, default=0.0,
+                        help="Elo difference of the SPRT null hypothesis")
+    parser.add_argument("--elo1", type=float, default=10.0,
+                        help="Elo difference of the SPRT alternative hypothesis")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="SPRT false positive rate")
+    parser.add_argument("--beta", type=float, default=0.05,
+                        help="SPRT false negative rate")
+    main(parser.parse_args())
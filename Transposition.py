@@ -0,0 +1,64 @@
+from array import array
+
+EXACT, LOWER, UPPER = 0, 1, 2  # bound types of a stored value
+NO_MOVE = 0xFFFF
+
+
+class TranspositionTable:
+    """
+    Fixed size transposition table on preallocated arrays. Each bucket holds two entries:
+    the first one is replaced only by a deeper search (or by any search once it is stale),
+    the second one is always replaced.
+    :param size_mb: memory cap of the table in megabytes
+    """
+    ENTRY_BYTES = 8 + 8 + 2 + 1 + 1 + 2  # hash, value, depth, bound, age, best move
+
+    def __init__(self, size_mb=64):
+        self.size = max(1, int(size_mb * 2 ** 20) // (2 * self.ENTRY_BYTES))
+        entries = 2 * self.size
+        self.hashes = array('Q', bytes(8 * entries))
+        self.values = array('d', bytes(8 * entries))
+        self.depths = array('h', [-1]) * entries  # -1 marks an empty entry
+        self.bounds = array('B', bytes(entries))
+        self.ages = array('B', bytes(entries))
+        self.moves = array('H', [NO_MOVE]) * entries
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        """
+        Marks the entries of former searches as stale. Called once per ply.
+        """
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, h):
+        """
+        :return: (depth, value, bound, move) of the stored entry, or None
+        """
+        self.probes += 1
+        i = 2 * (h % self.size)
+        for i in (i, i + 1):
+            if self.hashes[i] == h and self.depths[i] >= 0:
+                self.hits += 1
+                return self.depths[i], self.values[i], self.bounds[i], self.moves[i]
+        return None
+
+    def store(self, h, depth, value, bound, move=NO_MOVE):
+        i = 2 * (h % self.size)
+        if depth >= self.depths[i] or self.ages[i] != self.age:
+            if self.hashes[i] != h and self.depths[i] >= 0:
+                # the evicted entry moves to the always-replace tier
+                self._write(i + 1, self.hashes[i], self.depths[i], self.values[i], self.bounds[i], self.moves[i],
+                            self.ages[i])
+        else:
+            i += 1
+        self._write(i, h, depth, value, bound, move, self.age)
+
+    def _write(self, i, h, depth, value, bound, move, age):
+        self.hashes[i] = h
+        self.depths[i] = depth
+        self.values[i] = value
+        self.bounds[i] = bound
+        self.moves[i] = move
+        self.ages[i] = age
@@ -0,0 +1,103 @@
+from PyQt5.QtSvg import QSvgWidget
+from PyQt5.QtWidgets import QMainWindow, QToolBar, QAction
+
+import random
+
+
+class Game(QMainWindow):
+    def __init__(self, board, socket, args, create_agent, game_time=15):
+        super().__init__()
+
+        self.args = args
+        self.create_agent = create_agent
+        self.socket = socket
+        self.setGeometry(100, 100, 900, 915)
+
+        self.widgetSvg = QSvgWidget(parent=self)
+        self.widgetSvg.setGeometry(10, 25, 880, 880)
+
+        if self.args.color == "R":
+            # Choose random color
+            self.args.color = "B" if bool(random.getrandbits(1)) else "W"
+
+        self.board = board
+        self.game_time = game_time
+        # Initialize agents
+        self.agent = self.create_agent(self.args.agent, self.board, self.args.color, self.game_time)
+        self.agent2 = None
+
+        if not self.args.human and not self.args.server:
+            # 2 agents case
+            color2 = "W" if self.args.color == "B" else "B"
+            self.agent2 = self.create_agent(self.args.agent2, self.board, color2, self.game_time)
+        # Board visualization:
+        self.widgetSvg.load(self.board.fboardSvg)
+        self.toolbar = QToolBar("My main toolbar")
+        self.addToolBar(self.toolbar)
+        self.button_action = QAction("Make Move", self)
+        self.button_action.triggered.connect(self.play)
+        self.toolbar.addAction(self.button_action)
+
+        self.agent2_move = True
+
+        if self.args.color == "W" or (self.args.color == "B" and not self.board.white_turn):
+            time_msg = self.agent.ply()  # If agent is first
+            if self.args.pt:
+                print(time_msg)
+        self.update_board()
+
+        # print(self.agent.calcBranchingFactor(depth=15))
+
+    def play(self):
+        # self.agent2.heuristic(self.agent2.graph.get_node(self.agent.board.key()))
+        self.toolbar.removeAction(self.button_action)
+        if self.args.human:
+            self.board.player_move()
+            if self.check_winner():
+                return
+            time_msg = self.agent.ply()  # If agent is first
+            if self.args.pt:
+                print(time_msg)
+        elif self.args.server:
+            move = self.socket.recieve()
+            if move.endswith('1') or move.endswith('8'):
+                # for our visualizing protocol for end of game
+                move = move + 'q'
+            self.board.make_move(move)
+            self.update_board()
+            if self.check_winner():
+                return
+            agent_msg = self.agent.ply()  # If agent is first
+            if self.args.pt:
+                print(agent_msg[0])
+            if self.args.server:
+                self.socket.send(agent_msg[1].rstrip("q"))
+        else:  # If two agents- Make move is only on ply
+            if self.agent2_move:
+                time_msg = self.agent2.ply()  # If agent is first
+                if self.args.pt:
+                    print(time_msg)
+                if self.check_winner():
+                    return
+            else:
+                time_msg = self.agent.ply()  # If agent is first
+                if self.args.pt:
+                    print(time_msg)
+                if self.check_winner():
+                    return
+            self.agent2_move = not self.agent2_move
+        self.check_winner()
+        self.toolbar.addAction(self.button_action)
+
+    def update_board(self):
+        self.widgetSvg.load(self.board.fboardSvg)
+
+    def check_winner(self):
+        self.update_board()
+        result = self.board.is_checkmate()
+        if result[0]:
+            if (result[1] and self.args.color == "W") or (not result[1] and self.args.color == "B"):
+                print("Player1 Won!")
+            else:
+                print("Player2 Won!")
+        return result[0]